@@ -0,0 +1,147 @@
+import datetime
+
+MIN_HOUR_OBSERVATIONS = 5  # Past days needed before an hour of the day gets its own baseline
+MIN_OBSERVATIONS = 24  # Past hours needed before anything is flagged
+SPIKE_RATIO = 2  # A spike is at least this many times the usual rate, however steady the usual rate is
+END_FRACTION = 0.5  # A spike ends once the rate falls back this far from its threshold towards the usual rate
+MIN_HOUR_COVERAGE = 1800  # Seconds of samples an hour needs before it counts towards the baselines
+
+# Function to create the table of detected traffic spikes
+def init_anomaly_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS anomaly_events (
+            id INTEGER PRIMARY KEY,
+            start TEXT,
+            end TEXT,
+            total_bytes INTEGER,
+            co2_ng INTEGER,
+            peak_ng_per_second REAL,
+            baseline_ng_per_second REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_anomaly_events_start ON anomaly_events (start)')
+
+# Function to write a detected spike, inserting it when it starts and updating it as it grows and ends
+def record_anomaly(cursor, event):
+    values = (event['start'].strftime('%Y-%m-%d %H:%M:%S'),
+              event['end'].strftime('%Y-%m-%d %H:%M:%S') if event['end'] else None,
+              event['total_bytes'], event['co2_ng'], event['peak_rate'], event['baseline_rate'])
+    if event['id'] is None:
+        cursor.execute('''
+            INSERT INTO anomaly_events (start, end, total_bytes, co2_ng, peak_ng_per_second, baseline_ng_per_second)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', values)
+        event['id'] = cursor.lastrowid
+    else:
+        cursor.execute('''
+            UPDATE anomaly_events SET start = ?, end = ?, total_bytes = ?, co2_ng = ?, peak_ng_per_second = ?,
+                baseline_ng_per_second = ?
+            WHERE id = ?
+        ''', values + (event['id'],))
+
+# Function to read the newest spikes (one index lookup), end is None while a spike is still going on
+def fetch_recent_anomalies(cursor, limit=1):
+    cursor.execute('''
+        SELECT start, end, total_bytes, co2_ng, peak_ng_per_second, baseline_ng_per_second FROM anomaly_events
+        ORDER BY start DESC LIMIT ?
+    ''', (limit,))
+    return [{
+        'start': datetime.datetime.fromisoformat(start),
+        'end': datetime.datetime.fromisoformat(end) if end else None,
+        'total_bytes': total_bytes,
+        'co2_ng': co2_ng,
+        'peak_rate': peak_rate,
+        'baseline_rate': baseline_rate,
+    } for start, end, total_bytes, co2_ng, peak_rate, baseline_rate in cursor.fetchall()]
+
+# Running mean and variance in O(1) memory (Welford's algorithm)
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+# Flags traffic spikes as they happen: the current CO2 rate is compared with what is usual for the hour of the day,
+# learned from the hourly rollups and from every finished hour since; each sample costs O(1)
+class AnomalyDetector:
+    def __init__(self, sigma=4, min_rate=0):
+        self.sigma = sigma
+        self.min_rate = min_rate  # Nanograms per second below which nothing counts as a spike
+        self.hours = [RunningStats() for _ in range(24)]  # Hourly mean rates per hour of the day
+        self.all_hours = RunningStats()
+        self.current_hour = None
+        self.hour_ng = 0
+        self.hour_seconds = 0
+        self.hour_had_spike = False
+        self.event = None
+
+    # Function to seed the baselines from stored (hour, nanograms, seconds covered) rollups; like live hours,
+    # hours the tracker was not running for most of are left out, the rest are averaged over the time covered
+    def load_hours(self, hourly_points):
+        for hour, co2_ng, seconds in hourly_points:
+            if seconds >= MIN_HOUR_COVERAGE:
+                self._add_hour(hour, co2_ng / seconds)
+
+    def _add_hour(self, hour, rate):
+        self.hours[hour.hour].add(rate)
+        self.all_hours.add(rate)
+
+    # Function to get the rate above which a spike starts at this time, None while the baselines are still learning
+    def threshold(self, when):
+        baseline = self.hours[when.hour]
+        if baseline.count < MIN_HOUR_OBSERVATIONS:
+            # Too few days seen for this hour, compare with all hours instead
+            baseline = self.all_hours
+        if baseline.count < MIN_OBSERVATIONS and baseline is self.all_hours:
+            return None, baseline.mean
+        return max(baseline.mean + self.sigma * baseline.std(), SPIKE_RATIO * baseline.mean, self.min_rate), baseline.mean
+
+    # Function to check one sample; rate is the current smoothed rate in nanograms per second.
+    # Returns the spike event when one starts, grows or ends (to be written with record_anomaly), otherwise None
+    def add(self, when, total_bytes, co2_ng, interval, rate):
+        hour = when.replace(minute=0, second=0, microsecond=0)
+        if hour != self.current_hour:
+            # Hours with a spike are left out so spikes do not become the baseline
+            if self.current_hour is not None and self.hour_seconds >= MIN_HOUR_COVERAGE and not self.hour_had_spike:
+                self._add_hour(self.current_hour, self.hour_ng / self.hour_seconds)
+            self.current_hour = hour
+            self.hour_ng = 0
+            self.hour_seconds = 0
+            self.hour_had_spike = self.event is not None
+        self.hour_ng += co2_ng
+        self.hour_seconds += interval
+
+        threshold, baseline = self.threshold(when)
+        event = self.event
+        if event is None:
+            if threshold is None or rate <= threshold:
+                return None
+            self.event = event = {
+                'id': None,
+                'start': when - datetime.timedelta(seconds=interval),
+                'end': None,
+                'total_bytes': 0,
+                'co2_ng': 0,
+                'peak_rate': rate,
+                'baseline_rate': baseline,
+                'threshold': threshold,
+            }
+            self.hour_had_spike = True
+
+        event['total_bytes'] += total_bytes
+        event['co2_ng'] += co2_ng
+        event['peak_rate'] = max(event['peak_rate'], rate)
+        # Hysteresis: ending takes a clear drop, so a rate hovering at the threshold is one spike, not many
+        if rate < event['baseline_rate'] + END_FRACTION * (event['threshold'] - event['baseline_rate']):
+            event['end'] = when
+            self.event = None
+        return event
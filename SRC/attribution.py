@@ -0,0 +1,118 @@
+import psutil
+
+from units import nanograms_per_gb, co2_nanograms
+
+# Function to create the per-app usage table, in whole bytes and nanograms like the sample tables
+def init_attribution_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS app_usage (
+            day TEXT,
+            app TEXT,
+            total_bytes INTEGER,
+            co2_ng INTEGER,
+            PRIMARY KEY (day, app)
+        )
+    ''')
+
+# Function to add attributed traffic ({app: bytes}) to the per-app daily totals
+def add_to_app_usage(cursor, day, app_usage_bytes, co2_per_gb):
+    ng_per_gb = nanograms_per_gb(co2_per_gb)
+    cursor.executemany('''
+        INSERT INTO app_usage (day, app, total_bytes, co2_ng) VALUES (?, ?, ?, ?)
+        ON CONFLICT (day, app) DO UPDATE SET
+            total_bytes = total_bytes + excluded.total_bytes,
+            co2_ng = co2_ng + excluded.co2_ng
+    ''', [(day, app, usage_bytes, co2_nanograms(usage_bytes, ng_per_gb)) for app, usage_bytes in app_usage_bytes.items()])
+
+# Function to read the apps with the highest emissions for a day as (app, nanograms)
+def fetch_top_apps(cursor, day, limit=3):
+    cursor.execute('SELECT app, co2_ng FROM app_usage WHERE day = ? ORDER BY co2_ng DESC LIMIT ?', (day, limit))
+    return cursor.fetchall()
+
+# Function to read the I/O counter that best reflects a process's network traffic
+def process_io_bytes(io):
+    # Windows reports socket traffic as "other" I/O, Linux counts it in read/write chars
+    if hasattr(io, 'other_bytes'):
+        return io.other_bytes
+    if hasattr(io, 'read_chars'):
+        return io.read_chars + io.write_chars
+    return io.read_bytes + io.write_bytes
+
+# Splits machine-wide traffic between the apps that have network connections
+class ProcessAttributor:
+    def __init__(self, max_processes=200):
+        self.max_processes = max_processes
+        # pid -> [Process, app name, last I/O byte count]; metadata is read once per process
+        self.processes = {}
+        self.scan_offset = 0
+
+    # Function to find the pids that currently own an internet socket
+    def _connected_pids(self):
+        try:
+            return sorted({conn.pid for conn in psutil.net_connections(kind='inet') if conn.pid})
+        except psutil.AccessDenied:
+            # Without permission to list sockets every process is a candidate
+            return sorted(psutil.pids())
+
+    # Function to get the cached entry for a pid, caching new processes (returns None on first sight)
+    def _process_entry(self, pid):
+        entry = self.processes.get(pid)
+        if entry is not None:
+            return entry
+        process = psutil.Process(pid)
+        # Processes that deny access are remembered anyway, so they are not looked up again every scan
+        try:
+            name = process.name() or f'pid {pid}'
+        except psutil.AccessDenied:
+            name = f'pid {pid}'
+        try:
+            io_bytes = process_io_bytes(process.io_counters())
+        except psutil.AccessDenied:
+            io_bytes = None
+        # The first reading only sets the baseline
+        self.processes[pid] = [process, name, io_bytes]
+        return None
+
+    # Function to attribute machine-wide traffic (bytes) to apps, returns {app: whole bytes}
+    def sample(self, machine_bytes):
+        pids = self._connected_pids()
+
+        # Inspect at most max_processes per scan, rotating through the rest on later scans
+        if len(pids) > self.max_processes:
+            start = self.scan_offset % len(pids)
+            pids = (pids[start:] + pids[:start])[:self.max_processes]
+            self.scan_offset = start + self.max_processes
+
+        activity = {}
+        for pid in pids:
+            try:
+                entry = self._process_entry(pid)
+                if entry is None:
+                    continue
+                process, name, last_bytes = entry
+                if last_bytes is None:
+                    continue
+                if not process.is_running():
+                    raise psutil.NoSuchProcess(pid)
+                io_bytes = process_io_bytes(process.io_counters())
+                entry[2] = io_bytes
+                if io_bytes > last_bytes:
+                    activity[name] = activity.get(name, 0) + io_bytes - last_bytes
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                self.processes.pop(pid, None)
+            except psutil.AccessDenied:
+                continue
+
+        # Forget processes that have exited
+        if len(self.processes) > 2 * self.max_processes:
+            for pid in [pid for pid, entry in self.processes.items() if not entry[0].is_running()]:
+                del self.processes[pid]
+
+        total_activity = sum(activity.values())
+        if total_activity == 0 or machine_bytes <= 0:
+            return {}
+        shares = {name: machine_bytes * amount // total_activity for name, amount in activity.items()}
+        # The bytes lost rounding down go to the busiest app, so the shares add up to the machine's traffic
+        busiest = max(activity, key=activity.get)
+        shares[busiest] += machine_bytes - sum(shares.values())
+        return shares
@@ -0,0 +1,116 @@
+import argparse
+import datetime
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Pages copied per backup step and the pause between steps, so a backup never keeps the database busy for long
+BACKUP_STEP_PAGES = 64
+BACKUP_STEP_PAUSE = 0.01  # Seconds
+
+SNAPSHOT_PREFIX = 'co2_usage-'
+SNAPSHOT_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+# Function to list snapshots in a folder, oldest first
+def list_snapshots(backup_dir):
+    if not os.path.isdir(backup_dir):
+        return []
+    names = [name for name in os.listdir(backup_dir)
+             if name.startswith(SNAPSHOT_PREFIX) and (name.endswith('.db') or name.endswith('.db.gz'))]
+    return [os.path.join(backup_dir, name) for name in sorted(names)]
+
+# Function to get the time of the newest snapshot, None when there is none
+def last_snapshot_time(backup_dir):
+    snapshots = list_snapshots(backup_dir)
+    if not snapshots:
+        return None
+    stamp = os.path.basename(snapshots[-1])[len(SNAPSHOT_PREFIX):].split('.')[0]
+    return datetime.datetime.strptime(stamp, SNAPSHOT_TIME_FORMAT)
+
+# Function to delete the oldest snapshots beyond keep
+def rotate_snapshots(backup_dir, keep):
+    snapshots = list_snapshots(backup_dir)
+    removed = snapshots[:max(len(snapshots) - keep, 0)]
+    for path in removed:
+        os.remove(path)
+    return len(removed)
+
+# Function to copy a live database into a snapshot file with the online backup API.
+# The copy reads from one snapshot held open on the source: in WAL mode that blocks no writer,
+# so samples keep being stored while it runs and never make the backup start over
+def backup_database(db_path, backup_dir, keep=7, compress=True, now=None,
+                    step_pages=BACKUP_STEP_PAGES, step_pause=BACKUP_STEP_PAUSE):
+    now = now or datetime.datetime.now()
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, SNAPSHOT_PREFIX + now.strftime(SNAPSHOT_TIME_FORMAT) + '.db')
+    temp_path = path + '.tmp'
+    started = time.monotonic()
+
+    source = sqlite3.connect(db_path, isolation_level=None)
+    target = sqlite3.connect(temp_path)
+    try:
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(target, pages=step_pages, progress=lambda status, remaining, total: time.sleep(step_pause))
+        source.execute('COMMIT')
+        check = target.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f"Backup copy failed its check: {check}")
+    except Exception:
+        target.close()
+        os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+
+    if compress:
+        # Compressed from the finished copy, the live database is not touched any more
+        with open(temp_path, 'rb') as copy_file, gzip.open(path + '.gz.tmp', 'wb') as gzip_file:
+            shutil.copyfileobj(copy_file, gzip_file, 1024 * 1024)
+        os.remove(temp_path)
+        temp_path, path = path + '.gz.tmp', path + '.gz'
+    os.replace(temp_path, path)
+
+    return {
+        'path': path,
+        'size': os.path.getsize(path),
+        'seconds': time.monotonic() - started,
+        'removed': rotate_snapshots(backup_dir, keep),
+    }
+
+# Function to copy a snapshot back over a database with the backup API. Writing through SQLite, rather than
+# copying the file, also replaces anything in a co2_usage.db-wal file left next to it
+def restore_snapshot(snapshot_path, db_path):
+    temp_path = None
+    if snapshot_path.endswith('.gz'):
+        with gzip.open(snapshot_path, 'rb') as gzip_file, tempfile.NamedTemporaryFile(
+                'wb', suffix='.db', dir=os.path.dirname(os.path.abspath(db_path)), delete=False) as copy_file:
+            shutil.copyfileobj(gzip_file, copy_file, 1024 * 1024)
+            temp_path = copy_file.name
+    source = sqlite3.connect(temp_path or snapshot_path)
+    target = sqlite3.connect(db_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+        if temp_path:
+            os.remove(temp_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Restore co2_usage.db from a backup snapshot. Quit the tracker first.")
+    parser.add_argument('snapshot', help="co2_usage-YYYYMMDD-HHMMSS.db or .db.gz file")
+    parser.add_argument('--db', default=os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'co2_usage.db'),
+                        help="Database to overwrite")
+    args = parser.parse_args()
+    try:
+        restore_snapshot(args.snapshot, args.db)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Restore failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Restored {args.db} from {args.snapshot}")
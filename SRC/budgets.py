@@ -0,0 +1,193 @@
+import collections
+import datetime
+import threading
+import time
+
+from units import BYTES_PER_MB, NANOGRAMS_PER_GRAM
+
+PERIODS = ('day', 'week', 'year')
+METRICS = ('co2', 'data')  # CO2 limits are set in grams, data limits in MB
+HYSTERESIS_PERCENT = 5  # A rule that fired is armed again once usage is this many percent of the limit below it
+
+# Function to get the first day of the day, week (Monday) or year a date falls in
+def period_start(period, day):
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    return day.replace(month=1, day=1)
+
+# One budget: fires once when a period's usage reaches percent of limit, then waits until usage drops back
+class BudgetRule:
+    def __init__(self, name, period, metric, limit, percent=100):
+        if period not in PERIODS:
+            raise ValueError(f"Budget '{name}': period must be one of {', '.join(PERIODS)}")
+        if metric not in METRICS:
+            raise ValueError(f"Budget '{name}': metric must be one of {', '.join(METRICS)}")
+        if limit <= 0 or percent <= 0:
+            raise ValueError(f"Budget '{name}': limit and percent must be above zero")
+        self.name = name
+        self.period = period
+        self.metric = metric
+        self.limit = limit
+        self.percent = percent
+        # Compared with the running totals, which are whole nanograms and bytes
+        unit = NANOGRAMS_PER_GRAM if metric == 'co2' else BYTES_PER_MB
+        self.budget = limit * unit
+        self.trigger = self.budget * percent / 100
+        self.rearm = self.budget * (percent - HYSTERESIS_PERCENT) / 100
+        self.armed = True
+        self.last_fired = None
+
+# Keeps day, week and year totals of CO2 and traffic and checks budget rules against them as samples arrive;
+# per sample it is six additions and six comparisons, rules are only looked at when a total reaches one
+class BudgetEngine:
+    def __init__(self, rules, min_interval=3600, max_per_hour=5, clock=time.monotonic):
+        self.min_interval = min_interval  # Seconds before the same rule can alert again
+        self.max_per_hour = max_per_hour  # Alerts from all rules together
+        self.clock = clock
+        self.rules = {(period, metric): [] for period in PERIODS for metric in METRICS}
+        for rule in rules:
+            self.rules[(rule.period, rule.metric)].append(rule)
+        self.totals = dict.fromkeys(self.rules, 0)
+        self.next_trigger = dict.fromkeys(self.rules, float('inf'))
+        self.starts = dict.fromkeys(PERIODS)
+        self.day = None
+        self.sent_times = collections.deque()
+        self.deferred = set()  # Totals with rules held back by rate limiting, checked again at retry_at
+        self.retry_at = float('inf')
+        self.lock = threading.Lock()
+        for key in self.rules:
+            self._update_trigger(key)
+
+    # Function to set the totals of the periods containing today, e.g. from stored day summaries
+    def load(self, totals, today):
+        with self.lock:
+            self.day = today
+            for period in PERIODS:
+                self.starts[period] = period_start(period, today)
+            for key in self.rules:
+                self._set_total(key, totals.get(key, 0))
+
+    # Function to add one sample, returns the alerts it set off
+    def add(self, when, total_bytes, co2_ng):
+        day = when.date()
+        with self.lock:
+            if day != self.day:
+                if self.day is not None and day < self.day:
+                    return self._add_late(day, total_bytes, co2_ng)
+                self._roll(day)
+
+            alerts = []
+            if self.deferred and self.clock() >= self.retry_at:
+                self._retry()
+            for period in PERIODS:
+                for metric, amount in (('co2', co2_ng), ('data', total_bytes)):
+                    key = (period, metric)
+                    total = self.totals[key] + amount
+                    self.totals[key] = total
+                    if total >= self.next_trigger[key]:
+                        alerts += self._fire(key)
+            return alerts
+
+    # Function to count a sample from before the current day (e.g. just before midnight) in the periods it belongs to
+    def _add_late(self, day, total_bytes, co2_ng):
+        alerts = []
+        for period in PERIODS:
+            if period_start(period, day) != self.starts[period]:
+                continue
+            for metric, amount in (('co2', co2_ng), ('data', total_bytes)):
+                key = (period, metric)
+                self.totals[key] += amount
+                if self.totals[key] >= self.next_trigger[key]:
+                    alerts += self._fire(key)
+        return alerts
+
+    # Function to start new periods on a new day
+    def _roll(self, day):
+        self.day = day
+        for period in PERIODS:
+            start = period_start(period, day)
+            if start != self.starts[period]:
+                self.starts[period] = start
+                for metric in METRICS:
+                    self._set_total((period, metric), 0)
+
+    # Function to replace a total, re-arming rules it has fallen well below
+    def _set_total(self, key, total):
+        self.totals[key] = total
+        for rule in self.rules[key]:
+            if not rule.armed and total < rule.rearm:
+                rule.armed = True
+        self._update_trigger(key)
+
+    def _update_trigger(self, key):
+        if key in self.deferred:
+            return
+        self.next_trigger[key] = min((rule.trigger for rule in self.rules[key] if rule.armed), default=float('inf'))
+
+    # Function to fire the armed rules a total has reached. Rules held back by rate limiting stay armed,
+    # and their total is not compared again until they may fire, so a held-back rule costs nothing per sample
+    def _fire(self, key):
+        now = self.clock()
+        while self.sent_times and now - self.sent_times[0] >= 3600:
+            self.sent_times.popleft()
+        alerts = []
+        retry_at = float('inf')
+        total = self.totals[key]
+        for rule in self.rules[key]:
+            if not rule.armed or total < rule.trigger:
+                continue
+            if rule.last_fired is not None and now - rule.last_fired < self.min_interval:
+                retry_at = min(retry_at, rule.last_fired + self.min_interval)
+                continue
+            if len(self.sent_times) >= self.max_per_hour:
+                retry_at = min(retry_at, self.sent_times[0] + 3600)
+                continue
+            rule.armed = False
+            rule.last_fired = now
+            self.sent_times.append(now)
+            alerts.append({'rule': rule, 'total': total, 'percent_used': total * 100 / rule.budget})
+        self._update_trigger(key)
+        if retry_at != float('inf'):
+            self.deferred.add(key)
+            self.next_trigger[key] = float('inf')
+            self.retry_at = min(self.retry_at, retry_at)
+        return alerts
+
+    # Function to compare the held-back totals with their rules again once rate limiting allows
+    def _retry(self):
+        keys = self.deferred
+        self.deferred = set()
+        self.retry_at = float('inf')
+        for key in keys:
+            self._update_trigger(key)
+
+    # Function to set today's totals after a reset or its undo; the week and year move by the same amounts
+    def set_today(self, co2_ng, total_bytes):
+        with self.lock:
+            for metric, amount in (('co2', co2_ng), ('data', total_bytes)):
+                change = amount - self.totals[('day', metric)]
+                for period in PERIODS:
+                    self._set_total((period, metric), self.totals[(period, metric)] + change)
+
+# Function to build rules from the "budgets" config entries
+def rules_from_config(entries):
+    return [BudgetRule(entry['name'], entry['period'], entry['metric'], entry['limit'], entry.get('percent', 100))
+            for entry in entries]
+
+# Function to total each period containing today from a storage engine's day summaries (one lookup per stored day)
+def load_period_totals(storage, today):
+    totals = {}
+    year_start = period_start('year', today)
+    for day, _ in storage.daily_totals():
+        if day < year_start or day > today:
+            continue
+        summary = storage.day_summary(day.isoformat())
+        if summary is None:
+            continue
+        for period in PERIODS:
+            if day >= period_start(period, today):
+                totals[(period, 'co2')] = totals.get((period, 'co2'), 0) + summary['co2_ng']
+                totals[(period, 'data')] = totals.get((period, 'data'), 0) + summary['total_bytes']
+    return totals
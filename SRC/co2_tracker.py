@@ -9,15 +9,48 @@ import time
 import threading
 import datetime
 import sqlite3
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import bisect
 from PIL import Image, ImageTk
 import webbrowser
+import socket
+import shlex
+import json
+import queue
+import subprocess
+from history import lttb, RAW_HISTORY_MAX_SPAN, LEGACY_INTERVAL_MS
+from query_worker import QueryWorker, POLL_INTERVAL_MS, HIDDEN_POLL_INTERVAL_MS
+from projection import ProjectionModel
+from config import DEFAULT_CONFIG, load_config
+from attribution import ProcessAttributor, init_attribution_tables, add_to_app_usage, fetch_top_apps
+from storage import init_usage_tables, SQLiteBackend
+from sample_log import SampleLog
+from maintenance import run_maintenance, enable_incremental_vacuum
+from backup import backup_database, last_snapshot_time
+from resets import has_undoable_reset
+from state_store import StateStore, get_state_path
+from sampler import Sampler, AdaptiveScheduler, SAMPLE_INTERVAL
+from sample_cache import SampleCache, RESOLUTION, TIMESTAMP, CO2
+from collector import CollectorForwarder
+from spool import Spool
+from net_counters import open_counter_reader
+from sparkline import Sparkline, Ticker
+from rates import RollingRates
+from anomaly import AnomalyDetector, init_anomaly_tables, record_anomaly, fetch_recent_anomalies
+from budgets import BudgetEngine, rules_from_config, load_period_totals
+from units import BYTES_PER_MB, NANOGRAMS_PER_GRAM, nanograms_per_gb, co2_nanograms
 
 # Constants
 CO2_PER_GB = 0.16  # Updated: CO2 emissions per GB (0.16 grams per GB)
 AVERAGE_CO2_PER_YEAR = 300_000  # 300 kg in grams
+STORE_EVERY_SECONDS = 5  # Samples taken faster than this are stored in one batch
+LIVE_GRAPH_SECONDS = 600  # The live graph shows one point per second for the last 10 minutes
+PROJECTION_HALF_LIFE_DAYS = 14  # Days until a past day's weight in the projection halves
+HISTORY_RANGES = {
+    'Day': datetime.timedelta(days=1),
+    'Week': datetime.timedelta(weeks=1),
+    'Month': datetime.timedelta(days=30),
+    'Year': datetime.timedelta(days=365),
+}
 personal_reduction_target = 10  # Default personal target reduction percentage
 
 # Function to get the resource path (for icons, etc.)
@@ -28,8 +61,9 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-# Function to format CO2 units
-def format_co2(co2_grams):
+# Function to format CO2 units from whole nanograms
+def format_co2(co2_ng):
+    co2_grams = co2_ng / NANOGRAMS_PER_GRAM
     if co2_grams >= 1_000_000:
         return f"{co2_grams / 1_000_000:.2f} tonnes"
     elif co2_grams >= 1_000:
@@ -37,8 +71,9 @@ def format_co2(co2_grams):
     else:
         return f"{co2_grams:.2f} grams"
 
-# Function to format data units
-def format_data_units(data_mb):
+# Function to format data units from whole bytes
+def format_data_units(data_bytes):
+    data_mb = data_bytes / BYTES_PER_MB
     if data_mb >= 1_048_576:
         return f"{data_mb / 1_048_576:.2f} TB"
     elif data_mb >= 1024:
@@ -46,6 +81,10 @@ def format_data_units(data_mb):
     else:
         return f"{data_mb:.2f} MB"
 
+# Function to get the database path
+def get_db_path():
+    return os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'co2_usage.db')
+
 # Function to log errors
 def log_error(message):
     documents_folder = os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'logs')
@@ -55,6 +94,15 @@ def log_error(message):
     with open(log_path, 'a') as error_file:
         error_file.write(f"{datetime.datetime.now()}: {message}\n")
 
+# Function to log maintenance and other notable events
+def log_info(message):
+    documents_folder = os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'logs')
+    if not os.path.exists(documents_folder):
+        os.makedirs(documents_folder)
+    log_path = os.path.join(documents_folder, 'activity_log.txt')
+    with open(log_path, 'a') as activity_file:
+        activity_file.write(f"{datetime.datetime.now()}: {message}\n")
+
 # Function to initialize the database
 def init_database():
     documents_folder = os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker')
@@ -64,21 +112,19 @@ def init_database():
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
+    # Freed pages are returned in small steps by maintenance; converting an existing database takes a full VACUUM,
+    # done here because no sampler or collector thread is writing yet
+    if enable_incremental_vacuum(conn):
+        log_info("Switched co2_usage.db to incremental auto-vacuum")
+
+    # Write-ahead logging lets backups read a consistent copy while samples keep being written
+    cursor.execute('PRAGMA journal_mode=WAL')
+
     # Create necessary tables
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS network_usage (
-            timestamp TEXT,
-            data_sent REAL,
-            data_received REAL,
-            total_usage REAL,
-            daily_usage REAL
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS start_date (
-            start_date TEXT
-        )
-    ''')
+    init_usage_tables(cursor, CO2_PER_GB)
+    init_attribution_tables(cursor)
+    init_anomaly_tables(cursor)
+    conn.commit()
 
     # Set and fetch the tracking start date
     cursor.execute('SELECT * FROM start_date')
@@ -102,111 +148,423 @@ def reset_daily_usage():
     )
 
     if confirmation_code == "12345678":
-        db_path = os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'co2_usage.db')
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM network_usage WHERE timestamp >= ?', (datetime.datetime.now().strftime('%Y-%m-%d'),))
-        conn.commit()
-        conn.close()
-
-        # Clear log file
-        documents_folder = os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'logs')
-        log_path = os.path.join(documents_folder, 'error_log.txt')
-        with open(log_path, 'w') as log_file:
-            log_file.write('')  # Clear the log file
-
-        # Update GUI after reset
-        update_gui()
-        tk.messagebox.showinfo("Reset", "Reset successful!")
+        reset_button.config(state=tk.DISABLED)
+        query_worker.submit('reset', reset_todays_usage, finish_reset)
     else:
         tk.messagebox.showwarning("Reset", "Incorrect code. Reset canceled.")
 
+# Function to hide today's rows behind a reset marker (runs on the query worker)
+def reset_todays_usage(conn):
+    storage = get_storage(conn)
+    storage.reset(datetime.datetime.combine(datetime.date.today(), datetime.time.min), datetime.datetime.now())
+    storage.commit()
+
+    # Clear log file
+    documents_folder = os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'logs')
+    log_path = os.path.join(documents_folder, 'error_log.txt')
+    with open(log_path, 'w') as log_file:
+        log_file.write('')  # Clear the log file
+    return storage.supports_undo
+
+# Function to finish the reset once the rows are hidden
+def finish_reset(can_undo):
+    global daily_usage
+    reset_button.config(state=tk.NORMAL)
+    undo_reset_button.config(state=tk.NORMAL if can_undo else tk.DISABLED)
+    daily_usage = 0
+    sample_cache.discard_since(datetime.datetime.combine(datetime.date.today(), datetime.time.min))
+    projection.clear_today()
+    if budget_engine is not None:
+        budget_engine.set_today(0, 0)
+
+    # Update GUI after reset
+    update_gui()
+    tk.messagebox.showinfo("Reset", "Reset successful!")
+
+# Function to bring back the samples hidden by the last reset
+def undo_last_reset():
+    if tk.messagebox.askyesno("Undo Reset", "Restore the usage hidden by the last reset?"):
+        undo_reset_button.config(state=tk.DISABLED)
+        query_worker.submit('undo-reset', restore_reset_usage, finish_undo)
+
+# Function to undo the newest reset and reload what it hid (runs on the query worker)
+def restore_reset_usage(conn):
+    storage = get_storage(conn)
+    restored = storage.undo_reset()
+    storage.commit()
+    if restored is None:
+        return None
+    sample_cache.discard_since(restored[0])
+    sample_cache.load(storage)
+    today = storage.day_summary(datetime.date.today().isoformat())
+    return {
+        'todays_ng': storage.day_usage(datetime.date.today().isoformat()),
+        'todays_bytes': today['total_bytes'] if today else 0,
+        'can_undo': has_undoable_reset(conn.cursor()),
+    }
+
+# Function to show the restored totals
+def finish_undo(result):
+    global daily_usage
+    if result is None:
+        tk.messagebox.showinfo("Undo Reset", "There is no reset to undo.")
+        return
+    daily_usage = result['todays_ng']
+    projection.set_today(result['todays_ng'])
+    if budget_engine is not None:
+        budget_engine.set_today(result['todays_ng'], result['todays_bytes'])
+    undo_reset_button.config(state=tk.NORMAL if result['can_undo'] else tk.DISABLED)
+    update_gui()
+    tk.messagebox.showinfo("Undo Reset", "Reset undone!")
+
+# Function to get the configured storage engine for the calling thread's connection
+def get_storage(conn):
+    if sample_log is not None:
+        return sample_log
+    return SQLiteBackend(conn, CO2_PER_GB)
+
 # Function to get total network usage
 def get_total_network_usage():
-    net_io = psutil.net_io_counters()
-    return net_io.bytes_sent, net_io.bytes_recv
+    return read_network_counters()
+
+# Function to check whether the machine runs on battery, False where the OS cannot tell
+def on_battery_power():
+    battery = psutil.sensors_battery() if hasattr(psutil, 'sensors_battery') else None
+    return battery is not None and not battery.power_plugged
+
+# Function to store sampled (timestamp, sent bytes, received bytes, interval seconds) records and update the running totals;
+# back-filled records (live=False) are left out of the projection and the rates
+def store_samples(conn, records, live=True):
+    global daily_usage, daily_usage_date
+    storage = get_storage(conn)
+    try:
+        day_total, day, stored = storage.append_samples(records, daily_usage, daily_usage_date)
+        storage.commit()
+    except Exception:
+        # The caller keeps the records and stores them again, so none of a failed batch may stay behind
+        storage.rollback()
+        raise
+
+    # Only publish the new totals once the rows are safely stored
+    daily_usage, daily_usage_date = day_total, day
+    if collector_forwarder:
+        try:
+            collector_forwarder.put(records)
+        except Exception as e:
+            # The samples are already stored locally, so a full or broken spool must not make them retry
+            log_error(f"Error spooling samples for the collector: {str(e)}")
+    try:
+        publish_samples(conn, records, stored, live)
+    except Exception as e:
+        # The rows are committed, raising here would make the caller store them again
+        log_error(f"Error updating live figures from stored samples: {str(e)}")
+
+# Function to feed freshly stored samples to the cache, projection, rates, spike detector and budgets
+def publish_samples(conn, records, stored, live):
+    global current_co2_ng, last_sample_bytes
+    if stored:
+        # Per SAMPLE_INTERVAL, so the live figures read the same whatever interval the newest sample covered
+        interval = records[-1][3] or SAMPLE_INTERVAL
+        current_co2_ng = round(stored[-1][1] * SAMPLE_INTERVAL / interval)
+        last_sample_bytes = round(stored[-1][2] * SAMPLE_INTERVAL / interval)
+    spikes = {}
+    alerts = []
+    for (when, sent_bytes, recv_bytes, interval), (_, co2_ng, _) in zip(records, stored):
+        sample_cache.append(when, sent_bytes, recv_bytes, co2_ng)
+        if live:
+            projection.add_sample(when, co2_ng)
+            co2_rates.add(co2_ng, interval)
+            traffic_rates.add(sent_bytes + recv_bytes, interval)
+            if anomaly_detector is not None:
+                spike = anomaly_detector.add(when, sent_bytes + recv_bytes, co2_ng, interval, co2_rates.snapshot()[0])
+                if spike is not None:
+                    spikes[id(spike)] = spike
+            if budget_engine is not None:
+                alerts += budget_engine.add(when, sent_bytes + recv_bytes, co2_ng)
+    if alerts:
+        # Hooks and notifications can be slow, keep them off the sampling thread
+        threading.Thread(target=deliver_budget_alerts, args=(alerts,), daemon=True).start()
+    if spikes:
+        # One write per spike and batch, however many samples it spans
+        try:
+            for spike in spikes.values():
+                record_anomaly(conn.cursor(), spike)
+            conn.commit()
+        except Exception as e:
+            log_error(f"Error recording traffic spike: {str(e)}")
+
+# Function to describe a budget alert, e.g. "Daily CO2: 0.52 grams of 0.50 grams today (104%)"
+def format_budget_alert(alert):
+    rule = alert['rule']
+    amount = format_co2 if rule.metric == 'co2' else format_data_units
+    period = {'day': 'today', 'week': 'this week', 'year': 'this year'}[rule.period]
+    return f"{rule.name}: {amount(alert['total'])} of {amount(rule.budget)} {period} ({alert['percent_used']:.0f}%)"
+
+# Function to send budget alerts to the configured hook command, or else as desktop notifications
+def deliver_budget_alerts(alerts):
+    for alert in alerts:
+        message = format_budget_alert(alert)
+        log_info(f"Budget alert: {message}")
+        try:
+            if config['alert_command']:
+                rule = alert['rule']
+                command = config['alert_command']
+                command = shlex.split(command) if isinstance(command, str) else list(command)
+                env = dict(os.environ,
+                           CO2_ALERT_RULE=rule.name, CO2_ALERT_PERIOD=rule.period, CO2_ALERT_METRIC=rule.metric,
+                           CO2_ALERT_TOTAL=str(alert['total']), CO2_ALERT_LIMIT=str(round(rule.budget)),
+                           CO2_ALERT_PERCENT=f"{alert['percent_used']:.1f}")
+                subprocess.run(command + [message], env=env, timeout=30, check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            else:
+                notify_desktop("CO2 Budget", message)
+        except Exception as e:
+            log_error(f"Error delivering budget alert: {str(e)}")
+
+# Function to show a desktop notification, through the tray icon when there is one;
+# elsewhere without a tray icon the alert is only in activity_log.txt
+def notify_desktop(title, message):
+    if tray_icon is not None and getattr(tray_icon, 'HAS_NOTIFICATION', False):
+        tray_icon.notify(message, title)
+    elif sys.platform == 'darwin':
+        script = f'display notification {json.dumps(message)} with title {json.dumps(title)}'
+        subprocess.run(['osascript', '-e', script], timeout=10, check=True)
+    elif sys.platform.startswith('linux'):
+        subprocess.run(['notify-send', title, message], timeout=10, check=True)
+
+# Function to checkpoint the accumulators so a restart picks up where this left off
+def save_checkpoint(last_sent, last_recv, boot_time):
+    try:
+        state_store.save({
+            'day': daily_usage_date.isoformat(),
+            'daily_co2_ng': daily_usage,
+            'last_sent': last_sent,
+            'last_recv': last_recv,
+            'last_sample_time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'boot_time': boot_time,
+            # 1, 5 and 15 minute averages, for tools that watch the tracker
+            'co2_ng_per_second': co2_rates.snapshot(),
+            'bytes_per_second': traffic_rates.snapshot(),
+        })
+    except Exception as e:
+        log_error(f"Error saving checkpoint: {str(e)}")
 
 # Function to track network usage
 def track_network_usage():
-    global current_grams_per_hour, total_data_gb, daily_usage
-    db_path = os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'co2_usage.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    global daily_usage, daily_usage_date
+    conn = sqlite3.connect(get_db_path())
 
-    initial_sent, initial_recv = get_total_network_usage()
+    # Restore today's figure after a restart, the rollups are written with every sample
+    state = state_store.load()
+    today = datetime.datetime.now().date()
+    try:
+        daily_usage = get_storage(conn).day_usage(today.isoformat())
+    except Exception as e:
+        log_error(f"Error restoring daily usage: {str(e)}")
+        daily_usage = state.get('daily_co2_ng', 0) if state.get('day') == today.isoformat() else 0
+    daily_usage_date = today
 
-    while True:
+    # Recover the traffic that happened while the app was not running
+    sampler = Sampler()
+    boot_time = psutil.boot_time()
+    final_sent, final_recv = get_total_network_usage()
+    pending = sampler.start(final_sent, final_recv, state, boot_time)
+
+    try:
+        store_samples(conn, pending, live=False)
+        pending = []
+        projection.load_days(get_storage(conn).daily_totals())
+    except Exception as e:
+        log_error(f"Error back-filling network usage: {str(e)}")
+    if anomaly_detector is not None:
         try:
-            time.sleep(60)
+            # Hour-of-day baselines from the finished hours of the last few weeks, read from the hourly rollups
+            this_hour = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+            anomaly_detector.load_hours(get_storage(conn).hourly_coverage(
+                this_hour - datetime.timedelta(days=config['anomaly_baseline_days']), this_hour))
+        except Exception as e:
+            log_error(f"Error loading traffic baselines: {str(e)}")
+    if budget_engine is not None:
+        try:
+            # Day, week and year totals so far, back-filled traffic included
+            budget_engine.load(load_period_totals(get_storage(conn), today), today)
+        except Exception as e:
+            log_error(f"Error loading budget totals: {str(e)}")
+    try:
+        sample_cache.load(get_storage(conn))
+    except Exception as e:
+        log_error(f"Error loading sample cache: {str(e)}")
+    save_checkpoint(final_sent, final_recv, boot_time)
+    update_gui()
+
+    # Sample faster while traffic changes and slower while it is flat, within the configured bounds and battery budgets
+    scheduler = AdaptiveScheduler(
+        config['sample_min_seconds'],
+        config['sample_max_seconds'],
+        battery_cpu_percent=config['battery_cpu_budget_percent'],
+        battery_wakeups_per_minute=config['battery_wakeups_per_minute'],
+        on_battery=on_battery_power,
+    )
+    last_stored = time.monotonic()
+
+    while not stop_event.is_set():
+        try:
+            if stop_event.wait(sampler.interval):
+                break
+            busy_started = time.thread_time()
             final_sent, final_recv = get_total_network_usage()
+            records = sampler.sample(final_sent, final_recv)
+
+            # Keep records that failed to store (e.g. database busy) and retry them with the next sample;
+            # gaps are stored right away, fast samples once STORE_EVERY_SECONDS have passed
+            pending.extend(records)
+            if len(records) > 1 or time.monotonic() - last_stored >= STORE_EVERY_SECONDS:
+                store_samples(conn, pending)
+                pending = []
+                last_stored = time.monotonic()
+
+                save_checkpoint(final_sent, final_recv, boot_time)
+
+                # Update GUI
+                update_gui()
+
+            if config['adaptive_sampling']:
+                sampler.interval = scheduler.next_interval(
+                    sum(record[1] + record[2] for record in records),
+                    sum(record[3] for record in records),
+                    time.thread_time() - busy_started,
+                    datetime.datetime.now(),
+                )
+        except Exception as e:
+            log_error(f"Error in track_network_usage: {str(e)}")
 
-            data_sent_mb = (final_sent - initial_sent) / (1024 * 1024)
-            data_received_mb = (final_recv - initial_recv) / (1024 * 1024)
-            total_usage_mb = data_sent_mb + data_received_mb
-            total_data_gb = total_usage_mb / 1024
+    # Quitting: keep what is still waiting to be stored, then close so SQLite can remove the -wal and -shm files
+    try:
+        if pending:
+            store_samples(conn, pending)
+        save_checkpoint(final_sent, final_recv, boot_time)
+    except Exception as e:
+        log_error(f"Error storing samples on exit: {str(e)}")
+    conn.close()
 
-            # Calculate CO2 emissions for this session
-            grams_per_hour = total_data_gb * CO2_PER_GB  # Adjusted to 0.16 g/GB
-            current_grams_per_hour = grams_per_hour
+# Function to attribute network usage to apps at the configured cadence
+def track_app_usage():
+    conn = sqlite3.connect(get_db_path())
+    cursor = conn.cursor()
+    attributor = ProcessAttributor(config['attribution_max_processes'])
 
-            # Update the daily usage
-            daily_usage += grams_per_hour
+    initial_sent, initial_recv = get_total_network_usage()
+    attributor.sample(0)  # Record the per-process baselines
 
-            # Store network usage in the database
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('''
-                INSERT INTO network_usage (timestamp, data_sent, data_received, total_usage, daily_usage)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (timestamp, data_sent_mb, data_received_mb, total_usage_mb, daily_usage))
-            conn.commit()
+    while not stop_event.wait(config['attribution_interval_seconds']):
+        try:
+            final_sent, final_recv = get_total_network_usage()
+            usage_bytes = round(final_sent - initial_sent + final_recv - initial_recv)
+            initial_sent, initial_recv = final_sent, final_recv
 
-            # Update GUI
-            update_gui()
+            app_usage_bytes = attributor.sample(usage_bytes)
+            if app_usage_bytes:
+                add_to_app_usage(cursor, datetime.datetime.now().strftime('%Y-%m-%d'), app_usage_bytes, CO2_PER_GB)
+                conn.commit()
+        except Exception as e:
+            log_error(f"Error in track_app_usage: {str(e)}")
+    conn.close()
 
-            initial_sent, initial_recv = final_sent, final_recv
+# Function to compact and vacuum the database during idle periods
+def run_scheduled_maintenance():
+    last_run = None
+    while True:
+        time.sleep(600)  # Check every 10 minutes
+        try:
+            now = datetime.datetime.now()
+            if last_run is not None and now - last_run < datetime.timedelta(hours=config['maintenance_interval_hours']):
+                continue
+            # Wait for a quiet minute so maintenance does not compete with heavy traffic
+            if last_sample_bytes > config['maintenance_idle_mb'] * BYTES_PER_MB:
+                continue
+
+            conn = sqlite3.connect(get_db_path())
+            try:
+                report = run_maintenance(conn, config['db_size_budget_mb'] * BYTES_PER_MB, config['raw_retention_days'], now,
+                                         config['reset_undo_days'])
+            finally:
+                conn.close()
+            last_run = now
+
+            log_info(
+                f"Maintenance: reclaimed {format_data_units(report['reclaimed_bytes'])}, "
+                f"compacted {report['rows_compacted']} samples, "
+                f"purged {report['reset_rows_purged']} reset samples, "
+                f"database now {format_data_units(report['size_after'])}"
+            )
         except Exception as e:
-            log_error(f"Error in track_network_usage: {str(e)}")
+            log_error(f"Error in run_scheduled_maintenance: {str(e)}")
 
-    conn.close()
+# Function to back up co2_usage.db on a schedule, keeping the newest few snapshots
+def run_scheduled_backups():
+    backup_dir = config['backup_dir'] or os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'backups')
+    while True:
+        try:
+            # The newest snapshot's time survives restarts, so starting the app does not back up every time
+            last_run = last_snapshot_time(backup_dir)
+            now = datetime.datetime.now()
+            if last_run is None or now - last_run >= datetime.timedelta(hours=config['backup_interval_hours']):
+                report = backup_database(get_db_path(), backup_dir, config['backup_keep'], config['backup_compress'], now)
+                log_info(
+                    f"Backup: wrote {report['path']} ({format_data_units(report['size'])}) in {report['seconds']:.1f} s, "
+                    f"removed {report['removed']} old snapshots"
+                )
+        except Exception as e:
+            log_error(f"Error in run_scheduled_backups: {str(e)}")
+        time.sleep(600)  # Check every 10 minutes
 
 # Function to reset daily CO2 usage at midnight
 def reset_daily_usage_at_midnight():
-    global last_reset_date, daily_usage
+    global last_reset_date, daily_usage, daily_usage_date
     while True:
         current_date = datetime.datetime.now().date()
         if current_date != last_reset_date:
             last_reset_date = current_date
-            # Reset daily CO2 usage while keeping the total usage intact
-            daily_usage = 0
+            # Reset daily CO2 usage while keeping the total usage intact, unless a sample already did
+            if daily_usage_date != current_date:
+                daily_usage = 0
+                daily_usage_date = current_date
             update_gui()  # Update the GUI after resetting
         time.sleep(60)  # Check every minute
 
 # Function to update the live graph
 def update_graph(frame):
-    global current_grams_per_hour
-
-    # Append data for the graph
-    graph_data.append(current_grams_per_hour)
+    # Append data for the graph, in grams per hour (current_co2_ng is per SAMPLE_INTERVAL)
+    graph_data.append(current_co2_ng * 3600 / SAMPLE_INTERVAL / NANOGRAMS_PER_GRAM)
     time_data.append(len(graph_data))  # Store in seconds
+    draw_graph()
 
+# Function to draw the last 10 minutes of the live graph
+def draw_graph():
     # Limit the graph to the last 10 minutes (600 seconds)
-    graph_data_to_plot = graph_data[-600:]  # Last 600 seconds (10 minutes)
+    graph_data_to_plot = graph_data[-LIVE_GRAPH_SECONDS:]  # Last 600 seconds (10 minutes)
     time_data_to_plot = range(len(graph_data_to_plot))  # Generate range based on data length
 
-    # Calculate the rolling average
-    rolling_average = sum(graph_data_to_plot) / len(graph_data_to_plot) if graph_data_to_plot else 0
+    # The 5 minute average rate, in grams per hour like the plotted values
+    rolling_average = co2_rates.snapshot()[1] * 3600 / NANOGRAMS_PER_GRAM
+    average_label = f'5-min Average: {rolling_average:.2f} g/hour'
+
+    if live_sparkline is not None:
+        live_sparkline.plot(list(zip(time_data_to_plot, graph_data_to_plot)), (0, LIVE_GRAPH_SECONDS), rolling_average,
+                            'Live CO2 Emissions per Hour', average_label, ('0', '10 min'))
+        return
 
     # Clear the graph and plot the new data
     ax.clear()
     ax.plot(time_data_to_plot, graph_data_to_plot, color='blue', label='CO2 Emitted')
 
     # Add horizontal line for the rolling average
-    ax.axhline(rolling_average, color='green', linestyle='--', label=f'Rolling Average: {rolling_average:.2f} g/hour')
+    ax.axhline(rolling_average, color='green', linestyle='--', label=average_label)
 
     # Set graph labels and title
     ax.set_title('Live CO2 Emissions per Hour')
     ax.set_xlabel('Time (minutes)')
-    ax.set_ylabel('CO2 grams')
+    ax.set_ylabel('CO2 g/hour')
 
     # Set x-axis limits and ticks
     ax.set_xlim(0, 600)  # Limits for x-axis (in seconds)
@@ -219,59 +577,183 @@ def update_graph(frame):
 
     plt.tight_layout()  # Adjust layout to make room for titles
 
-# Function to update GUI labels
-def update_gui():
-    global current_grams_per_hour, projected_yearly_co2, daily_usage
-    db_path = os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'co2_usage.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
+# Function to fill in the seconds the live graph was hidden, as it would have shown them, from the cached samples
+def catch_up_graph(hidden_seconds):
+    missed = min(int(hidden_seconds), LIVE_GRAPH_SECONDS)
+    if missed <= 0:
+        return
+    now = time.time()
+    # Reach back far enough to find the sample that was newest when the window was hidden
+    data = sample_cache.slice(datetime.datetime.fromtimestamp(now - missed - 2 * config['sample_max_seconds']),
+                              datetime.datetime.fromtimestamp(now))
+    timestamps = data[TIMESTAMP].tolist()
+    co2_ng = data[CO2].tolist()
+    for second in range(missed, 0, -1):
+        # Each second showed the newest stored sample as grams per hour, like update_graph
+        index = bisect.bisect_right(timestamps, now - second) - 1
+        value = graph_data[-1] if graph_data else 0
+        if index >= 1:
+            interval = timestamps[index] - timestamps[index - 1] or SAMPLE_INTERVAL
+            value = co2_ng[index] * 3600 / interval / NANOGRAMS_PER_GRAM
+        graph_data.append(value)
+        time_data.append(len(graph_data))
+
+# Function to stop rendering while the main window is minimized or hidden in the tray
+def on_window_unmap(event):
+    # Child widgets share the root's bindings, only the window itself counts
+    if event.widget is root:
+        pause_rendering()
+
+# Function to resume rendering when the main window is shown again
+def on_window_map(event):
+    if event.widget is root:
+        resume_rendering()
+
+# Function to stop the animation, label refreshes and fast result polling
+def pause_rendering():
+    global window_visible, hidden_since
+    if not window_visible:
+        return
+    window_visible = False
+    hidden_since = time.monotonic()
+    ani.pause()
+    query_worker.poll_interval = HIDDEN_POLL_INTERVAL_MS
+
+# Function to start rendering again, catching up with one redraw
+def resume_rendering():
+    global window_visible
+    if window_visible:
+        return
+    window_visible = True
+    query_worker.poll_interval = POLL_INTERVAL_MS
+    catch_up_graph(time.monotonic() - hidden_since)
+    draw_graph()
+    if canvas_graph is not None:
+        canvas_graph.draw_idle()
+    ani.resume()
+    update_gui()
+
+# Function to show the main window from the tray
+def show_window():
+    root.deiconify()
+    root.lift()
+
+# Function to quit from the tray
+def quit_app():
+    if tray_icon is not None:
+        tray_icon.stop()
+    root.destroy()
+
+# Function to put an icon in the system tray, returns None when pystray is not installed
+def start_tray_icon():
     try:
-        cursor.execute('SELECT SUM(data_sent), SUM(data_received), SUM(total_usage), SUM(daily_usage) FROM network_usage')
-        result = cursor.fetchone()
-        total_sent_mb = result[0] or 0
-        total_received_mb = result[1] or 0
-        total_usage_mb = result[2] or 0
-        total_data_gb = total_usage_mb / 1024
-        total_co2_emissions_data = total_data_gb * CO2_PER_GB
-
-        # Total CO2 is accumulated since the start
-        total_co2_var.set(f"🌿 Total CO2: {format_co2(total_co2_emissions_data)}")
-
-        # Today's CO2 (daily usage)
-        if daily_usage < 1000:
-            todays_grams_var.set(f"🕛 Today's CO2 Emitted: {daily_usage:.2f} grams")
-        else:
-            todays_grams_var.set(f"🕛 Today's CO2 Emitted: {daily_usage / 1000:.2f} kg")
-
-        # Overall CO2 g/hour (current grams/hour)
-        grams_per_minute_var.set(f"💨 Overall Average CO2 g/hour: {current_grams_per_hour:.2f}")
-
-        # Data usage details
-        data_sent_var.set(f"⬆ Data Sent: {format_data_units(total_sent_mb)}")
-        data_received_var.set(f"⬇ Data Received: {format_data_units(total_received_mb)}")
-        total_data_used_var.set(f"🗂 Total Data Used: {format_data_units(total_usage_mb)}")
-
-        # Yearly projection based on average daily CO2
-        cursor.execute('SELECT start_date FROM start_date')
-        start_date = cursor.fetchone()[0]
-        start_date_dt = datetime.datetime.strptime(start_date, '%Y-%m-%d')
-        days_since_start = max((datetime.datetime.now() - start_date_dt).days, 1)
+        import pystray
+    except ImportError:
+        log_error("Tray mode needs pystray (pip install pystray), starting minimized instead")
+        return None
+
+    # Menu callbacks run on the tray's thread: they are queued, and a virtual event wakes the Tk main loop to run them.
+    # Nothing polls, so a window hidden in the tray costs no wakeups until a menu item is chosen
+    def on_main_loop(callback):
+        def queue_callback(icon, item):
+            tray_commands.put(callback)
+            root.event_generate('<<TrayCommand>>', when='tail')
+        return queue_callback
+
+    icon = pystray.Icon(
+        'co2_tracker',
+        Image.open(resource_path('SRC/app_icon.ico')),
+        "CO2 Internet Tracker",
+        pystray.Menu(
+            pystray.MenuItem("Show", on_main_loop(show_window), default=True),
+            pystray.MenuItem("Quit", on_main_loop(quit_app)),
+        ),
+    )
+    root.bind('<<TrayCommand>>', run_tray_commands)
+    icon.run_detached()
+    return icon
 
-        average_daily_co2 = total_co2_emissions_data / days_since_start
-        projected_yearly_co2 = average_daily_co2 * 365
-        projected_yearly_var.set(f"📅 Projected Yearly CO2: {format_co2(projected_yearly_co2)}")
+# Function to run the tray menu choices waiting for the Tk main loop
+def run_tray_commands(event=None):
+    while True:
+        try:
+            callback = tray_commands.get_nowait()
+        except queue.Empty:
+            return
+        callback()
+        if callback is quit_app:
+            return
+
+# Function to request a GUI refresh, safe to call from any thread
+def update_gui():
+    # Nothing is drawn while the window is hidden, showing it refreshes everything once
+    if not window_visible:
+        return
+    query_worker.submit('totals', load_totals, show_totals)
 
-        update_status()
-    except Exception as e:
-        log_error(f"Error in update_gui: {str(e)}")
+# Function to read the totals shown in the GUI (runs on the query worker)
+def load_totals(conn):
+    cursor = conn.cursor()
+    storage = get_storage(conn)
+    total_sent, total_received, total_bytes = storage.totals()
+    today = storage.day_summary(datetime.datetime.now().strftime('%Y-%m-%d'))
+    top_apps = []
+    if config['attribution_enabled']:
+        top_apps = fetch_top_apps(cursor, datetime.datetime.now().strftime('%Y-%m-%d'))
+    spikes = fetch_recent_anomalies(cursor, 1) if anomaly_detector is not None else []
+    return {
+        'total_sent': total_sent,
+        'total_received': total_received,
+        'total_bytes': total_bytes,
+        'todays_ng': today['co2_ng'] if today else 0,
+        'top_apps': top_apps,
+        'last_spike': spikes[0] if spikes else None,
+    }
+
+# Function to update GUI labels from the loaded totals
+def show_totals(totals):
+    total_bytes = totals['total_bytes']
+    total_co2_ng = co2_nanograms(total_bytes, nanograms_per_gb(CO2_PER_GB))
+
+    # Total CO2 is accumulated since the start
+    total_co2_var.set(f"🌿 Total CO2: {format_co2(total_co2_ng)}")
+
+    # Today's CO2, read from the stored day summary so it matches the database after restarts and resets
+    todays_grams_var.set(f"🕛 Today's CO2 Emitted: {format_co2(totals['todays_ng'])}")
+
+    # CO2 g/hour averaged over the last 1, 5 and 15 minutes
+    co2_rates_var.set("💨 CO2 g/hour (1/5/15 min): " + " / ".join(f"{rate * 3600 / NANOGRAMS_PER_GRAM:.2f}" for rate in co2_rates.snapshot()))
+
+    # Data usage details
+    data_sent_var.set(f"⬆ Data Sent: {format_data_units(totals['total_sent'])}")
+    data_received_var.set(f"⬇ Data Received: {format_data_units(totals['total_received'])}")
+    total_data_used_var.set(f"🗂 Total Data Used: {format_data_units(total_bytes)}")
+
+    # Apps driving today's emissions (attribution estimates are kept in grams)
+    if totals['top_apps']:
+        top_apps_var.set("📱 Top Apps Today: " + ", ".join(f"{app} ({format_co2(co2_ng)})" for app, co2_ng in totals['top_apps']))
+
+    # Newest traffic spike, still going on when it has no end yet
+    spike = totals['last_spike']
+    if spike:
+        usual = f" ({spike['peak_rate'] / spike['baseline_rate']:.0f}x usual)" if spike['baseline_rate'] > 0 else ""
+        if spike['end'] is None:
+            when = f"since {spike['start']:%H:%M}"
+        else:
+            when = f"{spike['start']:%Y-%m-%d %H:%M}-{spike['end']:%H:%M}"
+        spike_var.set(f"⚠ Traffic Spike: {when}, {format_data_units(spike['total_bytes'])}, {format_co2(spike['co2_ng'])}{usual}")
+        spike_label.config(fg='red' if spike['end'] is None else 'black')
 
-    conn.close()
+    update_status()
 
 # Function to update status based on target
 def update_status():
     global projected_yearly_co2
-    target_co2 = AVERAGE_CO2_PER_YEAR * (1 - personal_reduction_target / 100)
+    # Yearly projection from recent weekday/weekend daily averages
+    projected_yearly_co2 = projection.forecast_yearly()
+    projected_yearly_var.set(f"📅 Projected Yearly CO2: {format_co2(projected_yearly_co2)}")
+
+    target_co2 = AVERAGE_CO2_PER_YEAR * NANOGRAMS_PER_GRAM * (1 - personal_reduction_target / 100)
     if projected_yearly_co2 <= target_co2:
         status_var.set("Status: On Target")
         status_label.config(fg='green')
@@ -279,6 +761,108 @@ def update_status():
         status_var.set("Status: Above Target")
         status_label.config(fg='red')
 
+# Function to load and downsample history (runs on the query worker) as (time, nanograms per hour) points.
+# Every source is turned into the same rate, so a range plots alike whether it came from the cache or the database
+def load_history(conn, range_name, width):
+    end = datetime.datetime.now()
+    start = end - HISTORY_RANGES[range_name]
+    width = max(width, 200)
+
+    # Recent ranges come from the in-memory cache, the average rate over each pixel column
+    if sample_cache.covers(start):
+        times, co2_ng = sample_cache.resample(start, end, width, how='sum')
+        bucket_seconds = max((end - start).total_seconds() / width, 1)
+        return range_name, start, end, [(datetime.datetime.fromtimestamp(t), ng * 3600 / bucket_seconds)
+                                        for t, ng in zip(times, co2_ng)]
+
+    storage = get_storage(conn)
+    if end - start <= RAW_HISTORY_MAX_SPAN:
+        # Raw samples cover different intervals with adaptive sampling, so each is scaled by its own
+        points = [(when, co2_ng * 3600 * 1000 / (interval_ms or LEGACY_INTERVAL_MS))
+                  for when, _, _, co2_ng, interval_ms in storage.range_query(start, end)]
+    else:
+        # Longer ranges are hourly sums, which already are nanograms per hour
+        points = storage.history(start, end)
+    return range_name, start, end, lttb(points, width)
+
+# Function to open the zoomable history window
+def open_history_window():
+    window = tk.Toplevel(root)
+    window.title("CO2 History")
+    window.geometry("640x420")
+
+    if graph_engine == 'sparkline':
+        history_sparkline = Sparkline(window, 620, 360, unit='g/hour')
+        history_widget = history_sparkline.canvas
+    else:
+        history_fig = Figure(figsize=(6, 3.5))
+        history_ax = history_fig.add_subplot(111)
+        history_canvas = FigureCanvasTkAgg(history_fig, master=window)
+        history_widget = history_canvas.get_tk_widget()
+    selected_range = tk.StringVar(value='Day')
+    history_key = f'history-{id(window)}'
+
+    def show_history(result):
+        range_name, start, end, points = result
+        if not window.winfo_exists():
+            return
+        if graph_engine == 'sparkline':
+            label_format = '%H:%M' if range_name == 'Day' else '%Y-%m-%d'
+            history_sparkline.plot([(p[0].timestamp(), p[1] / NANOGRAMS_PER_GRAM) for p in points],
+                                   (start.timestamp(), end.timestamp()), title=f'CO2 Emissions - Last {range_name}',
+                                   x_labels=(start.strftime(label_format), end.strftime(label_format)))
+            return
+        history_ax.clear()
+        if points:
+            history_ax.plot([p[0] for p in points], [p[1] / NANOGRAMS_PER_GRAM for p in points], color='blue', label='CO2 Emitted')
+            history_ax.legend()
+        history_ax.set_title(f'CO2 Emissions - Last {range_name}')
+        history_ax.set_ylabel('CO2 g/hour')
+        history_ax.set_xlim(start, end)
+        history_ax.set_ylim(bottom=0)
+        history_fig.autofmt_xdate()
+        history_fig.tight_layout()
+        history_canvas.draw_idle()
+
+    def select_range(range_name):
+        selected_range.set(range_name)
+        width = history_widget.winfo_width()
+        # Submitting under the window's key drops any range still loading
+        query_worker.submit(history_key, load_history, show_history, range_name, width)
+
+    buttons_frame = tk.Frame(window)
+    buttons_frame.pack(pady=5)
+    for range_name in HISTORY_RANGES:
+        tk.Radiobutton(buttons_frame, text=range_name, value=range_name, variable=selected_range,
+                       indicatoron=False, width=8, command=lambda r=range_name: select_range(r)).pack(side=tk.LEFT, padx=2)
+
+    history_widget.pack(fill=tk.BOTH, expand=True)
+    window.bind('<Destroy>', lambda e: query_worker.cancel(history_key) if e.widget is window else None)
+    window.after(100, lambda: select_range('Day'))
+
+# Load user settings
+try:
+    config = load_config()
+except Exception as e:
+    log_error(f"Config loading error: {e}")
+    config = dict(DEFAULT_CONFIG)
+
+# Matplotlib is only imported for its graphs; the sparkline graphs draw on plain Tk canvases
+graph_engine = config['graph_engine']
+if graph_engine not in ('matplotlib', 'sparkline'):
+    log_error(f"Unknown graph_engine '{graph_engine}' in config.json, using matplotlib")
+    graph_engine = 'matplotlib'
+if graph_engine == 'matplotlib':
+    try:
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+    except ImportError as e:
+        # e.g. a build made without matplotlib
+        log_error(f"Matplotlib unavailable, using sparkline graphs: {e}")
+        graph_engine = 'sparkline'
+
 # Initialize the Tkinter root window
 root = tk.Tk()
 root.title("CO2 Internet Tracker")
@@ -317,26 +901,40 @@ data_sent_var = tk.StringVar(value="⬆ Data Sent: ")
 data_received_var = tk.StringVar(value="⬇ Data Received: ")
 total_data_used_var = tk.StringVar(value="🗂 Total Data Used: ")
 total_co2_var = tk.StringVar(value="🌿 Total CO2: ")
-grams_per_minute_var = tk.StringVar(value="💨 Overall Average CO2 g/hour: ")
+co2_rates_var = tk.StringVar(value="💨 CO2 g/hour (1/5/15 min): ")
 todays_grams_var = tk.StringVar(value="🕛 Today's CO2 Emitted: ")
 projected_yearly_var = tk.StringVar(value="📅 Projected Yearly CO2: ")
 average_user_var = tk.StringVar(value=f"👥 Assumed Average PC User CO2: {AVERAGE_CO2_PER_YEAR / 1000:.2f} kg")
 personal_target_var = tk.StringVar(value=f"🎯 Personal Target: {AVERAGE_CO2_PER_YEAR * (1 - personal_reduction_target / 100) / 1000:.2f} kg")
 status_var = tk.StringVar(value="📊 Status: ")
+top_apps_var = tk.StringVar(value="📱 Top Apps Today: ")
+spike_var = tk.StringVar(value="⚠ Traffic Spike: none detected")
 
 graph_data = []
 time_data = []
-current_grams_per_hour = 0
+window_visible = True
+hidden_since = None
+tray_icon = None
+tray_commands = queue.Queue()  # Tray menu callbacks waiting for the Tk main loop
+current_co2_ng = 0  # Emissions of the newest sample
+last_sample_bytes = 0
 projected_yearly_co2 = 0
-daily_usage = 0  # Initialize daily usage
+daily_usage = 0  # Today's CO2 in nanograms, restored from the rollups when tracking starts
+daily_usage_date = datetime.datetime.now().date()
+state_store = StateStore(get_state_path())
+read_network_counters = open_counter_reader()  # /proc/net/dev on Linux, psutil elsewhere
+projection = ProjectionModel(PROJECTION_HALF_LIFE_DAYS)
+co2_rates = RollingRates()  # CO2 nanograms per second over 1, 5 and 15 minutes
+traffic_rates = RollingRates()  # Bytes per second over 1, 5 and 15 minutes
 
 last_reset_date = datetime.datetime.now().date()
+stop_event = threading.Event()  # Set when the app quits
 
 tk.Label(scroll_frame, textvariable=data_sent_var, font=("Segoe", 12)).pack(pady=2)
 tk.Label(scroll_frame, textvariable=data_received_var, font=("Segoe", 12)).pack(pady=5)
 tk.Label(scroll_frame, textvariable=total_data_used_var, font=("Segoe", 12)).pack(pady=5)
 tk.Label(scroll_frame, textvariable=total_co2_var, font=("Segoe", 12)).pack(pady=5)
-tk.Label(scroll_frame, textvariable=grams_per_minute_var, font=("Segoe", 12), fg='blue').pack(pady=5)
+tk.Label(scroll_frame, textvariable=co2_rates_var, font=("Segoe", 12), fg='blue').pack(pady=5)
 tk.Label(scroll_frame, textvariable=todays_grams_var, font=("Segoe", 12)).pack(pady=5)
 tk.Label(scroll_frame, textvariable=projected_yearly_var, font=("Segoe", 12)).pack(pady=5)
 tk.Label(scroll_frame, textvariable=average_user_var, font=("Segoe", 10)).pack(pady=5)
@@ -344,6 +942,13 @@ tk.Label(scroll_frame, textvariable=personal_target_var, font=("Segoe", 12)).pac
 status_label = tk.Label(scroll_frame, textvariable=status_var, font=("Segoe", 12))
 status_label.pack(pady=5)
 
+if config['attribution_enabled']:
+    tk.Label(scroll_frame, textvariable=top_apps_var, font=("Segoe", 10), wraplength=420).pack(pady=5)
+
+spike_label = tk.Label(scroll_frame, textvariable=spike_var, font=("Segoe", 10), wraplength=420)
+if config['anomaly_detection']:
+    spike_label.pack(pady=5)
+
 tk.Label(scroll_frame, textvariable=start_date_var, font=("Segoe", 12)).pack(pady=5)
 
 tk.Label(scroll_frame, text="Set Personal Reduction Target (%):", font=("Segoe", 12)).pack(pady=5)
@@ -370,10 +975,22 @@ update_button.pack(pady=5)
 reset_button = tk.Button(scroll_frame, text="Reset", command=reset_daily_usage, font=("Segoe", 12))
 reset_button.pack(pady=5)
 
-fig, ax = plt.subplots(figsize=(4.5, 3))
-canvas_graph = FigureCanvasTkAgg(fig, master=scroll_frame)
-canvas_graph.draw()
-canvas_graph.get_tk_widget().pack(pady=5, fill=tk.BOTH, expand=True)
+undo_reset_button = tk.Button(scroll_frame, text="Undo Reset", command=undo_last_reset, font=("Segoe", 12), state=tk.DISABLED)
+undo_reset_button.pack(pady=5)
+
+history_button = tk.Button(scroll_frame, text="History", command=open_history_window, font=("Segoe", 12))
+history_button.pack(pady=5)
+
+live_sparkline = None
+canvas_graph = None
+if graph_engine == 'sparkline':
+    live_sparkline = Sparkline(scroll_frame, unit='g/hour')
+    live_sparkline.canvas.pack(pady=5, fill=tk.BOTH, expand=True)
+else:
+    fig, ax = plt.subplots(figsize=(4.5, 3))
+    canvas_graph = FigureCanvasTkAgg(fig, master=scroll_frame)
+    canvas_graph.draw()
+    canvas_graph.get_tk_widget().pack(pady=5, fill=tk.BOTH, expand=True)
 
 try:
     watermark_img = Image.open(resource_path('SRC/planet-help-logo2.png')).resize((150, 28), Image.Resampling.LANCZOS)
@@ -392,11 +1009,106 @@ link_label = tk.Label(scroll_frame, text="More resources here: planet.help/resou
 link_label.pack(pady=5)
 link_label.bind("<Button-1>", lambda e: open_website())
 
-ani = FuncAnimation(fig, update_graph, interval=1000, cache_frame_data=False)
+if live_sparkline is not None:
+    ani = Ticker(root, update_graph, 1000)
+else:
+    ani = FuncAnimation(fig, update_graph, interval=1000, cache_frame_data=False)
 
 init_database()
+query_worker = QueryWorker(root, get_db_path(), on_error=log_error)
+
+# Optional binary sample log in place of the SQLite sample tables
+sample_log = None
+if config['storage_engine'] == 'binlog':
+    sample_log = SampleLog(os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'samples.log'), CO2_PER_GB)
+
+# Recent samples for charts, kept in memory (the data folder exists once the database does);
+# fast adaptive samples are merged into RESOLUTION-second rows, so cache_days always fits
+sample_cache = SampleCache(
+    config['cache_days'],
+    RESOLUTION,
+    os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'sample_cache.bin') if config['cache_spill'] else None,
+)
 
-threading.Thread(target=track_network_usage, daemon=True).start()
+# Optional detection of traffic spikes, flagged as they happen and stored in co2_usage.db
+anomaly_detector = None
+if config['anomaly_detection']:
+    anomaly_detector = AnomalyDetector(
+        config['anomaly_sigma'],
+        # The floor is configured as traffic, the detector works on the CO2 rate
+        co2_nanograms(config['anomaly_min_mb_per_minute'] * BYTES_PER_MB, nanograms_per_gb(CO2_PER_GB)) / 60,
+    )
+
+# Optional daily, weekly and yearly CO2 and data budgets, checked against running totals as samples arrive
+budget_engine = None
+if config['budgets']:
+    try:
+        budget_engine = BudgetEngine(
+            rules_from_config(config['budgets']),
+            config['alert_min_interval_minutes'] * 60,
+            config['alert_max_per_hour'],
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        log_error(f"Invalid budgets in config.json, budget alerts are off: {str(e)}")
+
+# Optional upload of every stored sample to a central collector, spooled on disk while it is unreachable
+collector_forwarder = None
+if config['collector_address']:
+    collector_forwarder = CollectorForwarder(
+        config['collector_address'],
+        config['collector_host'] or socket.gethostname(),
+        Spool(os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'spool'), max_bytes=config['collector_spool_mb'] * BYTES_PER_MB),
+        config['collector_batch_samples'],
+        on_error=log_error,
+    )
+    collector_forwarder.start()
+
+# Offer Undo Reset if a reset from an earlier session can still be undone
+query_worker.submit(
+    'undo-state',
+    lambda conn: get_storage(conn).supports_undo and has_undoable_reset(conn.cursor()),
+    lambda can_undo: undo_reset_button.config(state=tk.NORMAL if can_undo else tk.DISABLED),
+)
+
+# Threads holding a connection to co2_usage.db, stopped and joined on exit
+connection_threads = [threading.Thread(target=track_network_usage, daemon=True)]
 threading.Thread(target=reset_daily_usage_at_midnight, daemon=True).start()
+threading.Thread(target=run_scheduled_maintenance, daemon=True).start()
+if config['backup_enabled']:
+    threading.Thread(target=run_scheduled_backups, daemon=True).start()
+if config['attribution_enabled']:
+    connection_threads.append(threading.Thread(target=track_app_usage, daemon=True))
+for thread in connection_threads:
+    thread.start()
+
+# Rendering stops while the window is minimized or hidden, only the sampler keeps running
+root.bind('<Unmap>', on_window_unmap)
+root.bind('<Map>', on_window_map)
+
+# Tray mode starts hidden; closing the window hides it again until Quit is chosen from the tray
+if config['start_in_tray'] or '--tray' in sys.argv:
+    tray_icon = start_tray_icon()
+    if tray_icon is not None:
+        root.protocol('WM_DELETE_WINDOW', root.withdraw)
+        root.withdraw()
+    else:
+        root.iconify()
+    # A window that starts hidden is never mapped, so there is no <Unmap> to pause on
+    pause_rendering()
 
 root.mainloop()
+
+# Close every connection to co2_usage.db, so the last one checkpoints the WAL and removes co2_usage.db-wal and -shm
+stop_event.set()
+for thread in connection_threads:
+    thread.join(timeout=10)
+query_worker.shutdown()
+
+# The binlog and the cache file are memory-mapped: write out their tails (and the log's index) once nothing uses them,
+# so the next start trusts the files instead of topping them up from the records
+try:
+    if sample_log is not None:
+        sample_log.close()
+    sample_cache.flush()
+except Exception as e:
+    log_error(f"Error flushing sample files on exit: {str(e)}")
@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+import os
+import random
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Wire format: every frame is a length and type header followed by its payload
+FRAME = struct.Struct('<IB')  # payload length, frame type
+HELLO, BATCH, ACK, COMPRESSED_BATCH = 1, 2, 3, 4
+HELLO_VERSION = struct.Struct('<H')  # followed by the UTF-8 host name
+SEQUENCE = struct.Struct('<Q')  # batch and ack sequence number
+SAMPLE = struct.Struct('<dqq')  # epoch seconds, sent bytes, received bytes
+PROTOCOL_VERSION = 1
+MAX_FRAME = 4 * 1024 * 1024
+DEFAULT_PORT = 7717
+MIN_RETRY_SECONDS = 5
+MAX_RETRY_SECONDS = 600
+UPLOAD_BATCHES = 100  # Batches read from the spool per upload round
+
+# Function to split 'tcp://host:port' or 'unix:///path/to/socket' into its kind and target
+def parse_address(address):
+    if address.startswith('unix://'):
+        return 'unix', address[len('unix://'):]
+    host, _, port = address[len('tcp://'):].rpartition(':') if address.startswith('tcp://') else address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port or DEFAULT_PORT))
+
+def encode_frame(frame_type, payload):
+    return FRAME.pack(len(payload), frame_type) + payload
+
+# Function to encode (epoch seconds, sent bytes, received bytes) samples as one batch frame
+def encode_batch(sequence, samples, compress=False):
+    body = b''.join(SAMPLE.pack(timestamp, round(sent_bytes), round(recv_bytes)) for timestamp, sent_bytes, recv_bytes in samples)
+    if compress:
+        return encode_frame(COMPRESSED_BATCH, SEQUENCE.pack(sequence) + zlib.compress(body))
+    return encode_frame(BATCH, SEQUENCE.pack(sequence) + body)
+
+# Function to decode a batch payload into its sequence number and (epoch seconds, sent, received) samples
+def decode_batch(payload, compressed=False):
+    sequence, = SEQUENCE.unpack_from(payload)
+    body = payload[SEQUENCE.size:]
+    if compressed:
+        decompressor = zlib.decompressobj()
+        body = decompressor.decompress(body, MAX_FRAME)
+        if decompressor.unconsumed_tail:
+            raise ValueError("compressed batch is too large")
+    return sequence, list(SAMPLE.iter_unpack(body))
+
+# Function to read one frame, returns None when the peer closed the connection between frames
+async def read_frame(reader):
+    try:
+        header = await reader.readexactly(FRAME.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise
+        return None
+    length, frame_type = FRAME.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes is too large")
+    return frame_type, await reader.readexactly(length)
+
+# Function to create the collector's tables
+def init_collector_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS hosts (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE,
+            last_seen INTEGER
+        )
+    ''')
+    # Keyed by host and time in milliseconds so a batch re-sent after a lost ack is stored once,
+    # while samples taken less than a second apart are all kept
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS host_usage (
+            host_id INTEGER,
+            timestamp_ms INTEGER,
+            data_sent INTEGER,
+            data_received INTEGER,
+            PRIMARY KEY (host_id, timestamp_ms)
+        ) WITHOUT ROWID
+    ''')
+
+# Central ingest service: many tracker instances push sample batches, one writer bulk-inserts them
+class Collector:
+    def __init__(self, db_path, client_buffer_batches=8, max_pending_rows=500_000, flush_rows=20_000, flush_interval=1.0, on_error=None):
+        self.db_path = db_path
+        self.client_buffer_batches = client_buffer_batches  # Unacknowledged batches held per client
+        self.max_pending_rows = max_pending_rows  # Rows held across all clients before reading pauses
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        # One thread owns the SQLite connection, so every database call goes through it
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.host_ids = {}
+        self.pending = []  # (writer, client buffer, sequence, host id, samples)
+        self.pending_rows = 0
+        self.stats = {'clients': 0, 'batches': 0, 'rows': 0, 'flushes': 0}
+        self.server = None
+
+    def _report(self, message):
+        if self.on_error:
+            self.on_error(message)
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        init_collector_tables(self.conn.cursor())
+        self.conn.commit()
+
+    # Function to look up or register a host, runs on the writer thread
+    def _host_id(self, name):
+        host_id = self.host_ids.get(name)
+        if host_id is None:
+            self.conn.execute('INSERT OR IGNORE INTO hosts (name) VALUES (?)', (name,))
+            host_id = self.conn.execute('SELECT id FROM hosts WHERE name = ?', (name,)).fetchone()[0]
+            self.host_ids[name] = host_id
+        return host_id
+
+    # Function to bulk insert a set of batches in one transaction, runs on the writer thread
+    def _write(self, batches):
+        rows = []
+        last_seen = {}
+        for _, _, _, host_id, samples in batches:
+            for timestamp, sent_bytes, recv_bytes in samples:
+                rows.append((host_id, round(timestamp * 1000), sent_bytes, recv_bytes))
+            if samples:
+                last_seen[host_id] = max(last_seen.get(host_id, 0), int(samples[-1][0]))
+        self.conn.executemany('INSERT OR IGNORE INTO host_usage VALUES (?, ?, ?, ?)', rows)
+        self.conn.executemany('UPDATE hosts SET last_seen = MAX(IFNULL(last_seen, 0), ?) WHERE id = ?',
+                              [(timestamp, host_id) for host_id, timestamp in last_seen.items()])
+        self.conn.commit()
+
+    async def _run_db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    # Function to serve one tracker connection until it disconnects
+    async def handle_client(self, reader, writer):
+        buffer = asyncio.Semaphore(self.client_buffer_batches)
+        try:
+            frame = await read_frame(reader)
+            if frame is None or frame[0] != HELLO:
+                return
+            version, = HELLO_VERSION.unpack_from(frame[1])
+            if version != PROTOCOL_VERSION:
+                raise ValueError(f"unsupported protocol version {version}")
+            host_id = await self._run_db(self._host_id, frame[1][HELLO_VERSION.size:].decode('utf-8'))
+            self.stats['clients'] += 1
+
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                if frame[0] not in (BATCH, COMPRESSED_BATCH):
+                    raise ValueError(f"unexpected frame type {frame[0]}")
+                sequence, samples = decode_batch(frame[1], frame[0] == COMPRESSED_BATCH)
+
+                # Backpressure: stop reading this socket while its buffer is full or the writer is behind,
+                # so the client's sends block in TCP flow control instead of queueing here
+                await buffer.acquire()
+                while self.pending_rows >= self.max_pending_rows:
+                    self.room.clear()
+                    await self.room.wait()
+                self.pending.append((writer, buffer, sequence, host_id, samples))
+                self.pending_rows += len(samples)
+                if self.pending_rows >= self.flush_rows:
+                    self.flush_now.set()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, struct.error, UnicodeDecodeError, zlib.error) as e:
+            self._report(f"Collector dropped a client: {str(e)}")
+        except asyncio.CancelledError:
+            pass  # The collector is shutting down
+        finally:
+            writer.close()
+
+    # Function to write everything buffered and acknowledge it
+    async def flush(self):
+        if not self.pending:
+            return
+        batches, rows = self.pending, self.pending_rows
+        self.pending, self.pending_rows = [], 0
+        try:
+            await self._run_db(self._write, batches)
+        except sqlite3.Error as e:
+            # Keep the batches (and their clients blocked) and try again on the next flush
+            self._report(f"Collector write failed: {str(e)}")
+            self.pending[:0] = batches
+            self.pending_rows += rows
+            return
+
+        self.stats['batches'] += len(batches)
+        self.stats['rows'] += rows
+        self.stats['flushes'] += 1
+        for writer, buffer, sequence, _, _ in batches:
+            buffer.release()
+            if not writer.is_closing():
+                writer.write(encode_frame(ACK, SEQUENCE.pack(sequence)))
+        self.room.set()
+
+    async def _write_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_now.clear()
+            await self.flush()
+
+    # Function to open the database and start listening on a tcp:// or unix:// address
+    async def start(self, address):
+        self.room = asyncio.Event()
+        self.room.set()
+        self.flush_now = asyncio.Event()
+        await self._run_db(self._open)
+
+        kind, target = parse_address(address)
+        if kind == 'unix':
+            if os.path.exists(target):
+                os.remove(target)
+            self.server = await asyncio.start_unix_server(self.handle_client, target, backlog=4096)
+        else:
+            self.server = await asyncio.start_server(self.handle_client, *target, backlog=4096, reuse_address=True)
+        self.write_task = asyncio.create_task(self._write_loop())
+        return self.server
+
+    # Function to stop accepting clients, write what is buffered and close the database
+    async def close(self):
+        self.server.close()
+        self.write_task.cancel()
+        await self.flush()
+        await self._run_db(self.conn.close)
+        self.executor.shutdown()
+
+# Asyncio client for one tracker instance, keeps sent batches until the collector acknowledges them
+class CollectorClient:
+    def __init__(self, address, host, window=4, compress=False):
+        self.address = address
+        self.host = host
+        self.compress = compress
+        self.window_size = window
+        self.window = asyncio.Semaphore(window)  # Batches in flight before send() waits
+        self.sequence = 0
+        self.unacked = {}  # sequence -> samples
+        self.drained = asyncio.Event()
+        self.drained.set()
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        kind, target = parse_address(self.address)
+        if kind == 'unix':
+            self.reader, self.writer = await asyncio.open_unix_connection(target)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(*target)
+        self.writer.write(encode_frame(HELLO, HELLO_VERSION.pack(PROTOCOL_VERSION) + self.host.encode('utf-8')))
+        self.acks = asyncio.create_task(self._read_acks())
+
+    async def _read_acks(self):
+        try:
+            while True:
+                frame = await read_frame(self.reader)
+                if frame is None:
+                    raise ConnectionError("collector closed the connection")
+                if frame[0] == ACK:
+                    sequence, = SEQUENCE.unpack(frame[1])
+                    if self.unacked.pop(sequence, None) is not None:
+                        self.window.release()
+                    if not self.unacked:
+                        self.drained.set()
+        finally:
+            # Wake a sender waiting on the window or on flush() so it sees the connection is gone
+            for _ in range(self.window_size):
+                self.window.release()
+            self.drained.set()
+
+    # Function to send one batch of (epoch seconds, sent bytes, received bytes), waits while too many are unacknowledged
+    async def send(self, samples):
+        await self.window.acquire()
+        if self.acks.done():
+            self.window.release()
+            self.acks.result()  # Raises the reason the connection ended
+        self.sequence += 1
+        self.unacked[self.sequence] = samples
+        self.drained.clear()
+        self.writer.write(encode_batch(self.sequence, samples, self.compress))
+        await self.writer.drain()
+        return self.sequence
+
+    # Function to wait until every sent batch is acknowledged
+    async def flush(self):
+        await self.drained.wait()
+        if self.acks.done():
+            self.acks.result()
+
+    async def close(self):
+        if self.writer:
+            self.acks.cancel()
+            self.writer.close()
+
+# Uploads the tracker's spooled samples to a collector from a background thread
+class CollectorForwarder:
+    def __init__(self, address, host, spool, batch_samples=5, on_error=None):
+        self.address = address
+        self.host = host
+        self.spool = spool
+        self.batch_samples = batch_samples
+        self.on_error = on_error
+
+    def start(self):
+        threading.Thread(target=asyncio.run, args=(self._run(),), daemon=True).start()
+
+    # Function to hand stored (datetime, sent bytes, received bytes, interval) records to the uploader, never blocks on the network
+    def put(self, records):
+        self.spool.append(records)
+
+    # Function to send everything spooled in batches, moving the spool on once the collector has it all
+    async def _upload(self, client):
+        samples, position = self.spool.read(self.batch_samples * UPLOAD_BATCHES)
+        for first in range(0, len(samples), self.batch_samples):
+            await client.send(samples[first:first + self.batch_samples])
+        await client.flush()
+        self.spool.ack(position, len(samples))
+
+    # Function to wait until a full batch is spooled
+    async def _wait_for_batch(self):
+        while self.spool.unread < self.batch_samples:
+            self.appended.clear()
+            if self.spool.unread >= self.batch_samples:
+                break
+            await self.appended.wait()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self.appended = asyncio.Event()
+        self.spool.on_append = lambda: loop.call_soon_threadsafe(self.appended.set)
+        delay = MIN_RETRY_SECONDS
+        while True:
+            await self._wait_for_batch()
+            client = CollectorClient(self.address, self.host, compress=True)
+            try:
+                await client.connect()
+                while True:
+                    await self._upload(client)
+                    delay = MIN_RETRY_SECONDS
+                    await self._wait_for_batch()
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+                if self.on_error:
+                    self.on_error(f"Error uploading to collector, retrying in {delay:.0f}s: {str(e)}")
+                # The spool only moves on after an ack, so anything unacknowledged is read and sent again
+                await client.close()
+                await asyncio.sleep(delay * random.uniform(1, 1.5))
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+
+async def run_collector(args):
+    collector = Collector(args.db, args.client_buffer, args.max_pending_rows, on_error=lambda message: print(message, file=sys.stderr))
+    await collector.start(args.listen)
+    print(f"Collector listening on {args.listen}, writing {args.db}", flush=True)
+    stop = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    except (NotImplementedError, AttributeError):
+        pass  # No SIGTERM handlers on Windows, Ctrl+C still stops the collector
+    try:
+        await stop.wait()
+    finally:
+        await collector.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect sample batches from many tracker instances into one database.")
+    parser.add_argument('--listen', default=f'tcp://0.0.0.0:{DEFAULT_PORT}', help="tcp://host:port or unix:///path/to/socket")
+    parser.add_argument('--db', default='collector.db', help="SQLite database to write")
+    parser.add_argument('--client-buffer', type=int, default=8, help="Unacknowledged batches buffered per client")
+    parser.add_argument('--max-pending-rows', type=int, default=500_000, help="Rows buffered in total before reading pauses")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_collector(args))
+    except KeyboardInterrupt:
+        pass
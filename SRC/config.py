@@ -0,0 +1,54 @@
+import json
+import os
+
+# Settings read from config.json in the data folder, missing keys fall back to these
+DEFAULT_CONFIG = {
+    'attribution_enabled': False,  # Sample per-process network activity
+    'attribution_interval_seconds': 300,  # How often to attribute traffic to apps
+    'attribution_max_processes': 200,  # Processes inspected per attribution scan
+    'db_size_budget_mb': 200,  # Target on-disk size of co2_usage.db
+    'raw_retention_days': 90,  # Per-minute samples kept before compacting to hourly rollups
+    'maintenance_interval_hours': 24,  # Minimum time between maintenance runs
+    'maintenance_idle_mb': 1,  # Only run maintenance when the last minute moved less than this
+    'reset_undo_days': 7,  # A reset can be undone for this long, maintenance then deletes the samples
+    'backup_enabled': True,  # Back up co2_usage.db while the app runs, without pausing sampling
+    'backup_interval_hours': 24,  # Time between backups
+    'backup_keep': 7,  # Snapshots kept, older ones are deleted
+    'backup_compress': True,  # Gzip the snapshots
+    'backup_dir': None,  # Where snapshots go, defaults to backups/ in the data folder
+    'adaptive_sampling': True,  # Sample faster during bursts and slower while traffic is flat, instead of every minute
+    'sample_min_seconds': 0.5,  # Shortest time between counter readings
+    'sample_max_seconds': 300,  # Longest time between counter readings
+    'battery_cpu_budget_percent': 0.5,  # On battery, share of one CPU core sampling may use
+    'battery_wakeups_per_minute': 4,  # On battery, most counter readings per minute
+    'graph_engine': 'matplotlib',  # How graphs are drawn: 'matplotlib' or 'sparkline' (plain Tk canvas, no matplotlib)
+    'start_in_tray': False,  # Start hidden in the system tray (needs pystray) with only the sampler running, same as --tray
+    'anomaly_detection': True,  # Flag traffic spikes far above what is usual for the hour of the day
+    'anomaly_sigma': 4,  # Standard deviations above the usual rate that make a spike
+    'anomaly_min_mb_per_minute': 5,  # Traffic below this rate is never a spike
+    'anomaly_baseline_days': 28,  # Days of hourly rollups the usual rates are learned from at start
+    'budgets': [],  # Alerts, e.g. {"name": "Daily CO2", "period": "day", "metric": "co2", "limit": 0.5, "percent": 80}; limit in grams or MB
+    'alert_command': None,  # Run this with the message instead of a desktop notification, details in CO2_ALERT_* variables
+    'alert_min_interval_minutes': 60,  # Shortest time between two alerts from the same budget
+    'alert_max_per_hour': 5,  # Most budget alerts per hour from all budgets together
+    'cache_days': 7,  # Days of samples kept in memory for charts
+    'cache_spill': True,  # Back the in-memory cache with a memory-mapped file
+    'storage_engine': 'sqlite',  # Where samples are stored: 'sqlite' or 'binlog'
+    'collector_address': None,  # Push samples to a collector, e.g. 'tcp://collector:7717' or 'unix:///run/co2.sock'
+    'collector_host': None,  # Name reported to the collector, defaults to the computer's host name
+    'collector_batch_samples': 5,  # Samples sent per batch
+    'collector_spool_mb': 64,  # Disk space for samples waiting for upload, oldest dropped beyond this
+}
+
+# Function to get the config file path
+def get_config_path():
+    return os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'config.json')
+
+# Function to load the config, merged over the defaults
+def load_config(config_path=None):
+    config = dict(DEFAULT_CONFIG)
+    config_path = config_path or get_config_path()
+    if os.path.exists(config_path):
+        with open(config_path) as config_file:
+            config.update(json.load(config_file))
+    return config
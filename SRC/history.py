@@ -0,0 +1,257 @@
+import datetime
+
+# Spans up to this length are read from the raw per-minute samples,
+# anything longer comes from the hourly rollups
+RAW_HISTORY_MAX_SPAN = datetime.timedelta(days=2)
+
+# Samples converted from the MB table of earlier versions have no interval (NULL), they were taken once a minute
+LEGACY_INTERVAL_MS = 60_000
+
+# A raw sample's rate in bytes per second, for the peak rate of its hour and day
+RAW_BYTES_PER_SECOND = f'''(network_usage.bytes_sent + network_usage.bytes_received) * 1000.0
+    / COALESCE(NULLIF(network_usage.interval_ms, 0), {LEGACY_INTERVAL_MS})'''
+
+# Raw samples hidden by a reset that maintenance has not purged yet (see resets.py)
+RAW_HIDDEN_BY_RESET = '''EXISTS (
+    SELECT 1 FROM resets WHERE resets.undone = 0 AND resets.purged = 0
+        AND network_usage.timestamp >= resets.start AND network_usage.timestamp < resets.end
+        AND network_usage.rowid <= resets.last_rowid
+)'''
+
+# Function to check whether a table has a column, used to spot the MB sample table of earlier versions
+def table_has_column(cursor, table, column):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+# Function to get a sample's rate in bytes per second from its interval in milliseconds
+def bytes_per_second(total_bytes, interval_ms):
+    return total_bytes * 1000 / (interval_ms or LEGACY_INTERVAL_MS)
+
+# Function to create the rollup tables and indexes used by the history view
+def init_history_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS hourly_usage (
+            hour TEXT PRIMARY KEY,
+            bytes_sent INTEGER,
+            bytes_received INTEGER,
+            co2_ng INTEGER,
+            samples INTEGER,
+            peak_bytes_per_second REAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_summary (
+            day TEXT PRIMARY KEY,
+            bytes_sent INTEGER,
+            bytes_received INTEGER,
+            co2_ng INTEGER,
+            samples INTEGER,
+            peak_bytes_per_second REAL,
+            first_sample TEXT,
+            last_sample TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_network_usage_timestamp ON network_usage (timestamp)')
+
+    # Build the rollups once for databases created before they existed
+    cursor.execute('SELECT 1 FROM hourly_usage LIMIT 1')
+    if cursor.fetchone() is None:
+        rebuild_hourly_usage(cursor)
+    cursor.execute('SELECT 1 FROM daily_summary LIMIT 1')
+    if cursor.fetchone() is None:
+        refresh_daily_summary(cursor)
+
+# Function to rebuild the hourly rollups from the raw samples
+def rebuild_hourly_usage(cursor):
+    cursor.execute('DELETE FROM hourly_usage')
+    cursor.execute(f'''
+        INSERT INTO hourly_usage (hour, bytes_sent, bytes_received, co2_ng, samples, peak_bytes_per_second)
+        SELECT substr(timestamp, 1, 13) || ':00:00', SUM(bytes_sent), SUM(bytes_received), SUM(co2_ng),
+               COUNT(*), MAX({RAW_BYTES_PER_SECOND})
+        FROM network_usage
+        GROUP BY substr(timestamp, 1, 13)
+    ''')
+
+# Function to add one sample (interval in milliseconds) to its hourly rollup
+def add_to_hourly_usage(cursor, timestamp, bytes_sent, bytes_received, co2_ng, interval_ms):
+    hour = timestamp[:13] + ':00:00'
+    cursor.execute('''
+        INSERT INTO hourly_usage (hour, bytes_sent, bytes_received, co2_ng, samples, peak_bytes_per_second)
+        VALUES (?, ?, ?, ?, 1, ?)
+        ON CONFLICT (hour) DO UPDATE SET
+            bytes_sent = bytes_sent + excluded.bytes_sent,
+            bytes_received = bytes_received + excluded.bytes_received,
+            co2_ng = co2_ng + excluded.co2_ng,
+            samples = samples + 1,
+            peak_bytes_per_second = MAX(peak_bytes_per_second, excluded.peak_bytes_per_second)
+    ''', (hour, bytes_sent, bytes_received, co2_ng, bytes_per_second(bytes_sent + bytes_received, interval_ms)))
+
+# Function to add one sample (interval in milliseconds) to its day's summary
+def add_to_daily_summary(cursor, timestamp, bytes_sent, bytes_received, co2_ng, interval_ms):
+    cursor.execute('''
+        INSERT INTO daily_summary (day, bytes_sent, bytes_received, co2_ng, samples, peak_bytes_per_second, first_sample, last_sample)
+        VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            bytes_sent = bytes_sent + excluded.bytes_sent,
+            bytes_received = bytes_received + excluded.bytes_received,
+            co2_ng = co2_ng + excluded.co2_ng,
+            samples = samples + 1,
+            peak_bytes_per_second = MAX(peak_bytes_per_second, excluded.peak_bytes_per_second),
+            first_sample = MIN(first_sample, excluded.first_sample),
+            last_sample = MAX(last_sample, excluded.last_sample)
+    ''', (timestamp[:10], bytes_sent, bytes_received, co2_ng, bytes_per_second(bytes_sent + bytes_received, interval_ms),
+          timestamp, timestamp))
+
+# Function to rebuild the day summaries from the hourly rollups, for days from first_day onwards or all days
+def refresh_daily_summary(cursor, first_day='', last_day='~'):
+    cursor.execute('DELETE FROM daily_summary WHERE day >= ? AND day <= ?', (first_day, last_day))
+    cursor.execute('''
+        INSERT INTO daily_summary (day, bytes_sent, bytes_received, co2_ng, samples, peak_bytes_per_second, first_sample, last_sample)
+        SELECT substr(hour, 1, 10), SUM(bytes_sent), SUM(bytes_received), SUM(co2_ng),
+               SUM(samples), MAX(peak_bytes_per_second), MIN(hour), MAX(hour)
+        FROM hourly_usage
+        WHERE hour >= ? AND hour < ?
+        GROUP BY substr(hour, 1, 10)
+    ''', (first_day, last_day + '~'))
+
+    # Exact first and last times where the raw samples are still kept, the hour otherwise
+    cursor.execute('''
+        UPDATE daily_summary SET
+            first_sample = COALESCE((SELECT MIN(timestamp) FROM network_usage WHERE timestamp >= day AND timestamp < day || '~'), first_sample),
+            last_sample = COALESCE((SELECT MAX(timestamp) FROM network_usage WHERE timestamp >= day AND timestamp < day || '~'), last_sample)
+        WHERE day >= ? AND day <= ?
+    ''', (first_day, last_day))
+
+# Function to load what active resets hide per hour as {hour: (sent bytes, received bytes, nanograms, samples)}
+def load_hidden_hours(cursor, start_hour='', end_hour='~'):
+    cursor.execute('''
+        SELECT reset_hours.hour, SUM(reset_hours.bytes_sent), SUM(reset_hours.bytes_received),
+               SUM(reset_hours.co2_ng), SUM(reset_hours.samples)
+        FROM reset_hours JOIN resets ON resets.id = reset_hours.reset_id
+        WHERE resets.undone = 0 AND resets.purged = 0 AND reset_hours.hour >= ? AND reset_hours.hour < ?
+        GROUP BY reset_hours.hour
+    ''', (start_hour, end_hour))
+    return {row[0]: row[1:] for row in cursor.fetchall()}
+
+# Function to read one day's (YYYY-MM-DD) summary with a primary key lookup, None for days without samples
+def fetch_day_summary(cursor, day):
+    cursor.execute('''
+        SELECT bytes_sent, bytes_received, co2_ng, samples, peak_bytes_per_second, first_sample, last_sample
+        FROM daily_summary WHERE day = ?
+    ''', (day,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    hidden = load_hidden_hours(cursor, day, day + '~')
+    if hidden:
+        # A reset hides part of the day: subtract its sums, the peak and first/last come from the visible samples
+        row = [value - sum(hour[i] for hour in hidden.values()) for i, value in enumerate(row[:4])]
+        if row[3] <= 0:
+            return None
+        cursor.execute(f'''
+            SELECT MAX({RAW_BYTES_PER_SECOND}), MIN(timestamp), MAX(timestamp) FROM network_usage
+            WHERE timestamp >= ? AND timestamp < ? AND NOT {RAW_HIDDEN_BY_RESET}
+        ''', (day, day + '~'))
+        row += list(cursor.fetchone())
+    return {
+        'bytes_sent': row[0],
+        'bytes_received': row[1],
+        'total_bytes': row[0] + row[1],
+        'co2_ng': row[2],
+        'samples': row[3],
+        'peak_bytes_per_second': row[4],
+        'first_sample': datetime.datetime.fromisoformat(row[5]),
+        'last_sample': datetime.datetime.fromisoformat(row[6]),
+    }
+
+# Function to read (hour, nanograms, seconds covered by samples) for the hours in a range. Hours whose raw samples
+# are kept add up their intervals; compacted hours only have a sample count, taken as one-minute samples
+def fetch_hourly_coverage(cursor, start, end):
+    start_hour = start.strftime('%Y-%m-%d %H:00:00')
+    end_text = end.strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute(f'''
+        SELECT substr(timestamp, 1, 13) || ':00:00', SUM(co2_ng), SUM(COALESCE(NULLIF(interval_ms, 0), {LEGACY_INTERVAL_MS}))
+        FROM network_usage
+        WHERE timestamp >= ? AND timestamp < ? AND NOT {RAW_HIDDEN_BY_RESET}
+        GROUP BY substr(timestamp, 1, 13)
+    ''', (start_hour, end_text))
+    hours = {hour: (co2_ng or 0, interval_ms / 1000) for hour, co2_ng, interval_ms in cursor.fetchall()}
+
+    cursor.execute('SELECT hour, co2_ng, samples FROM hourly_usage WHERE hour >= ? AND hour < ?', (start_hour, end_text))
+    rows = [row for row in cursor.fetchall() if row[0] not in hours]
+    hidden = load_hidden_hours(cursor, start_hour, end_text) if rows else {}
+    for hour, co2_ng, samples in rows:
+        if hour in hidden:
+            co2_ng -= hidden[hour][2]
+            samples -= hidden[hour][3]
+        if samples > 0:
+            hours[hour] = (co2_ng or 0, min(samples * LEGACY_INTERVAL_MS / 1000, 3600))
+    return [(datetime.datetime.fromisoformat(hour), co2_ng, seconds) for hour, (co2_ng, seconds) in sorted(hours.items())]
+
+# Function to fetch CO2 history for a time range as (datetime, nanograms) points
+def fetch_history(cursor, start, end):
+    start_text = start.strftime('%Y-%m-%d %H:%M:%S')
+    end_text = end.strftime('%Y-%m-%d %H:%M:%S')
+
+    if end - start <= RAW_HISTORY_MAX_SPAN:
+        cursor.execute(f'''
+            SELECT timestamp, co2_ng FROM network_usage
+            WHERE timestamp >= ? AND timestamp < ? AND NOT {RAW_HIDDEN_BY_RESET}
+            ORDER BY timestamp
+        ''', (start_text, end_text))
+        return [(datetime.datetime.fromisoformat(row[0]), row[1] or 0) for row in cursor.fetchall()]
+
+    cursor.execute('''
+        SELECT hour, co2_ng, samples FROM hourly_usage
+        WHERE hour >= ? AND hour < ?
+        ORDER BY hour
+    ''', (start_text[:13] + ':00:00', end_text))
+    rows = cursor.fetchall()
+
+    # Take out what active resets hide, hours they hide completely disappear
+    hidden = load_hidden_hours(cursor, start_text[:13] + ':00:00', end_text)
+    points = []
+    for hour, co2_ng, samples in rows:
+        if hour in hidden:
+            co2_ng -= hidden[hour][2]
+            if samples - hidden[hour][3] <= 0:
+                continue
+        points.append((datetime.datetime.fromisoformat(hour), co2_ng or 0))
+    return points
+
+# Function to downsample points with Largest-Triangle-Three-Buckets
+def lttb(points, threshold):
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    xs = [p[0].timestamp() if isinstance(p[0], datetime.datetime) else p[0] for p in points]
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle corner
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, len(points))
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(p[1] for p in points[next_start:next_end]) / count
+
+        # Pick the point in this bucket forming the largest triangle
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = xs[a], points[a][1]
+        max_area = -1
+        chosen = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        sampled.append(points[chosen])
+        a = chosen
+
+    sampled.append(points[-1])
+    return sampled
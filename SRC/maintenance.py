@@ -0,0 +1,77 @@
+import datetime
+
+from history import RAW_HISTORY_MAX_SPAN
+from resets import purge_resets
+
+# Rows deleted and pages vacuumed per transaction, keeps the write lock short
+COMPACT_BATCH_ROWS = 5000
+VACUUM_BATCH_PAGES = 256
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Function to get the on-disk size of the database in bytes
+def get_db_size(conn):
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    return page_count * page_size
+
+# Function to switch the database to incremental auto-vacuum. A new database only records the setting,
+# an existing one is rebuilt once with a full VACUUM, so call it at start-up before anything else writes
+def enable_incremental_vacuum(conn):
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return False
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+# Function to delete raw samples older than the cutoff, their hours stay in hourly_usage
+def compact_raw_samples(conn, cutoff):
+    cutoff_text = cutoff.strftime('%Y-%m-%d %H:00:00')
+    deleted = 0
+    while True:
+        cursor = conn.execute('''
+            DELETE FROM network_usage WHERE rowid IN (
+                SELECT rowid FROM network_usage WHERE timestamp < ? LIMIT ?
+            )
+        ''', (cutoff_text, COMPACT_BATCH_ROWS))
+        conn.commit()
+        deleted += cursor.rowcount
+        if cursor.rowcount < COMPACT_BATCH_ROWS:
+            return deleted
+
+# Function to return free pages to the file system in small steps
+def incremental_vacuum(conn):
+    while conn.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_BATCH_PAGES})')
+        conn.commit()
+
+# Function to compact, vacuum and analyze the database within a size budget
+def run_maintenance(conn, budget_bytes, raw_retention_days, now=None, reset_undo_days=7):
+    now = now or datetime.datetime.now()
+    size_before = get_db_size(conn)
+
+    # Resets only hide samples; once they can no longer be undone the samples are deleted here
+    reset_rows = purge_resets(conn, now - datetime.timedelta(days=reset_undo_days))
+
+    retention = datetime.timedelta(days=raw_retention_days)
+    deleted = compact_raw_samples(conn, now - retention)
+    incremental_vacuum(conn)
+
+    # Over budget: keep less raw history, but never less than the history view reads
+    while get_db_size(conn) > budget_bytes and retention > RAW_HISTORY_MAX_SPAN:
+        retention = max(retention / 2, RAW_HISTORY_MAX_SPAN)
+        deleted += compact_raw_samples(conn, now - retention)
+        incremental_vacuum(conn)
+
+    conn.execute('ANALYZE')
+    conn.commit()
+
+    size_after = get_db_size(conn)
+    return {
+        'size_before': size_before,
+        'size_after': size_after,
+        'reclaimed_bytes': max(size_before - size_after, 0),
+        'rows_compacted': deleted,
+        'reset_rows_purged': reset_rows,
+        'raw_retention_days': retention.total_seconds() / 86400,
+    }
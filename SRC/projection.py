@@ -0,0 +1,93 @@
+import datetime
+import threading
+
+WEEKDAYS_PER_YEAR = 365 * 5 / 7
+WEEKEND_DAYS_PER_YEAR = 365 * 2 / 7
+
+# Function to pick the usage profile for a date
+def day_profile(day):
+    return 'weekend' if day.weekday() >= 5 else 'weekday'
+
+# Keeps exponentially weighted daily CO2 totals (nanograms) per profile, updated in O(1) per sample
+class ProjectionModel:
+    def __init__(self, half_life_days=14):
+        # Weight of a finished day so that a day's influence halves every half_life_days
+        self.alpha = 1 - 0.5 ** (1 / half_life_days)
+        self.daily_ng = {'weekday': None, 'weekend': None}
+        self.current_day = None
+        self.current_ng = 0  # Exact sum of today's whole-nanogram samples
+        self.lock = threading.Lock()
+
+    # Function to fold a finished day into its profile average
+    def _close_day(self, day, co2_ng):
+        profile = day_profile(day)
+        average = self.daily_ng[profile]
+        if average is None:
+            self.daily_ng[profile] = co2_ng
+        else:
+            self.daily_ng[profile] = average + self.alpha * (co2_ng - average)
+
+    # Function to add one sample's emissions
+    def add_sample(self, when, co2_ng):
+        day = when.date()
+        with self.lock:
+            # Back-filled samples from a day already folded in are left out
+            if self.current_day is not None and day < self.current_day:
+                return
+            if day != self.current_day:
+                if self.current_day is not None:
+                    self._close_day(self.current_day, self.current_ng)
+                self.current_day = day
+                self.current_ng = 0
+            self.current_ng += co2_ng
+
+    # Function to seed the model from stored (date, nanograms) daily totals
+    def load_days(self, daily_totals):
+        with self.lock:
+            if self.current_day is None:
+                self.current_day = datetime.date.today()
+            for day, co2_ng in sorted(daily_totals):
+                if day >= self.current_day:
+                    if day == self.current_day:
+                        self.current_ng += co2_ng
+                    continue
+                self._close_day(day, co2_ng)
+
+    # Function to forget today's emissions after a manual reset
+    def clear_today(self):
+        with self.lock:
+            self.current_ng = 0
+
+    # Function to restore today's emissions after a reset is undone
+    def set_today(self, co2_ng):
+        with self.lock:
+            self.current_ng = co2_ng
+
+    # Function to estimate the daily nanograms for a profile, blending in today's partial day
+    def _daily_rate(self, profile, now):
+        average = self.daily_ng[profile]
+        if average is None:
+            other = 'weekend' if profile == 'weekday' else 'weekday'
+            average = self.daily_ng[other]
+
+        if self.current_day != now.date() or day_profile(self.current_day) != profile:
+            return average
+
+        day_start = datetime.datetime.combine(self.current_day, datetime.time.min)
+        elapsed = (now - day_start).total_seconds() / 86400
+        if elapsed <= 0:
+            return average
+        todays_pace = self.current_ng / elapsed
+        if average is None:
+            return todays_pace
+        # Today counts as much as a finished day would, scaled by how much of it has passed
+        weight = self.alpha * elapsed
+        return average + weight * (todays_pace - average)
+
+    # Function to forecast the next year's emissions in nanograms
+    def forecast_yearly(self, now=None):
+        now = now or datetime.datetime.now()
+        with self.lock:
+            weekday = self._daily_rate('weekday', now) or 0
+            weekend = self._daily_rate('weekend', now) or 0
+        return weekday * WEEKDAYS_PER_YEAR + weekend * WEEKEND_DAYS_PER_YEAR
@@ -0,0 +1,100 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+# How often the Tk main loop collects finished query results (milliseconds)
+POLL_INTERVAL_MS = 50
+HIDDEN_POLL_INTERVAL_MS = 1000  # While the window is hidden, nothing waits on a result
+
+# Runs database work on a thread pool and hands results back to the Tk main loop
+class QueryWorker:
+    def __init__(self, root, db_path, max_workers=2, on_error=None):
+        self.root = root
+        self.db_path = db_path
+        self.on_error = on_error
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='co2-query')
+        self.results = queue.Queue()
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.poll_interval = POLL_INTERVAL_MS
+        self.root.after(self.poll_interval, self._deliver_results)
+
+    # Each pool thread keeps its own connection, sqlite3 objects are not shareable
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # Only its pool thread uses it, shutdown() closes it once that thread has finished
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    # Function to queue a query, replacing any unfinished request with the same key
+    def submit(self, key, query, callback=None, *args):
+        with self.lock:
+            stale = self.pending.get(key)
+            if stale is not None:
+                stale.cancel()
+            future = self.executor.submit(self._run, query, args)
+            self.pending[key] = future
+        future.add_done_callback(lambda f: self.results.put((key, f, callback)))
+        return future
+
+    # Function to cancel an unfinished request
+    def cancel(self, key):
+        with self.lock:
+            future = self.pending.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def _run(self, query, args):
+        conn = self._connection()
+        try:
+            return query(conn, *args)
+        except Exception:
+            conn.rollback()
+            raise
+
+    # Runs on the Tk main loop, so callbacks are free to touch widgets
+    def _deliver_results(self):
+        while True:
+            try:
+                key, future, callback = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            with self.lock:
+                # A newer request under the same key supersedes this one
+                if self.pending.get(key) is not future:
+                    continue
+                del self.pending[key]
+
+            try:
+                result = future.result()
+            except CancelledError:
+                continue
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(f"Error in query '{key}': {str(e)}")
+                continue
+
+            if callback is not None:
+                try:
+                    callback(result)
+                except Exception as e:
+                    if self.on_error is not None:
+                        self.on_error(f"Error in query callback '{key}': {str(e)}")
+
+        self.root.after(self.poll_interval, self._deliver_results)
+
+    # Function to stop the pool, dropping queued queries, and close its connections
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,31 @@
+import math
+import threading
+
+RATE_WINDOWS = (60, 300, 900)  # Seconds: 1, 5 and 15 minute averages, like the Unix load average
+
+# Keeps exponentially weighted per-second rates over several time windows, updated in O(1) per sample
+class RollingRates:
+    def __init__(self, windows=RATE_WINDOWS):
+        self.windows = windows
+        self.rates = None
+        self.lock = threading.Lock()
+
+    # Function to fold in an amount (bytes, nanograms) measured over elapsed seconds
+    def add(self, amount, elapsed):
+        if elapsed <= 0:
+            return
+        rate = amount / elapsed
+        with self.lock:
+            if self.rates is None:
+                # Start from the first rate rather than climbing from zero for the first 15 minutes
+                self.rates = [rate] * len(self.windows)
+                return
+            # A sample moves each average by a weight set by the time it covers, not by counting samples,
+            # so averages mean the same whatever interval the sampler is running at
+            self.rates = [average + (1 - math.exp(-elapsed / window)) * (rate - average)
+                          for average, window in zip(self.rates, self.windows)]
+
+    # Function to read the per-second rates, one per window, zero before the first sample
+    def snapshot(self):
+        with self.lock:
+            return tuple(self.rates) if self.rates is not None else (0,) * len(self.windows)
@@ -0,0 +1,125 @@
+import datetime
+
+from history import RAW_HIDDEN_BY_RESET, load_hidden_hours, refresh_daily_summary
+
+# Function to create the tables that record resets and what each one hides per hour
+def init_reset_tables(cursor):
+    # A reset hides the samples in [start, end) stored before it (rowid up to last_rowid)
+    # until maintenance purges them, or until it is undone
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resets (
+            id INTEGER PRIMARY KEY,
+            start TEXT,
+            end TEXT,
+            created TEXT,
+            last_rowid INTEGER,
+            undone INTEGER DEFAULT 0,
+            purged INTEGER DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reset_hours (
+            reset_id INTEGER,
+            hour TEXT,
+            bytes_sent INTEGER,
+            bytes_received INTEGER,
+            co2_ng INTEGER,
+            samples INTEGER,
+            PRIMARY KEY (reset_id, hour)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reset_hours_hour ON reset_hours (hour)')
+
+# Function to hide the samples stored so far in [start, end) without deleting them, returns the reset id
+def record_reset(cursor, start, end, now=None):
+    now = now or datetime.datetime.now()
+    start_text = start.strftime('%Y-%m-%d %H:%M:%S')
+    end_text = end.strftime('%Y-%m-%d %H:%M:%S')
+    start_hour = start.replace(minute=0, second=0, microsecond=0)
+    if start_hour != start:
+        start_hour += datetime.timedelta(hours=1)
+    first_full_hour = start_hour.strftime('%Y-%m-%d %H:%M:%S')
+    end_hour = end_text[:13] + ':00:00'
+
+    cursor.execute('SELECT MAX(rowid) FROM network_usage')
+    last_rowid = cursor.fetchone()[0] or 0
+
+    # Snapshot what becomes hidden per hour, leaving out what earlier resets already hide,
+    # so reads subtract a few rows instead of scanning the samples. Whole hours come from the rollups,
+    # raw samples are read only for the partial hours at either edge, so the cost does not grow with the sample count
+    if first_full_hour < end_hour:
+        edges = [(start_text, first_full_hour), (end_hour, end_text)]
+    else:
+        edges = [(start_text, end_text)]
+    hours = {}
+    for edge_start, edge_end in edges:
+        cursor.execute(f'''
+            SELECT substr(timestamp, 1, 13) || ':00:00', SUM(bytes_sent), SUM(bytes_received), SUM(co2_ng), COUNT(*)
+            FROM network_usage
+            WHERE timestamp >= ? AND timestamp < ? AND NOT {RAW_HIDDEN_BY_RESET}
+            GROUP BY substr(timestamp, 1, 13)
+        ''', (edge_start, edge_end))
+        for hour, *values in cursor.fetchall():
+            hours[hour] = tuple(values)
+
+    already_hidden = load_hidden_hours(cursor, first_full_hour, end_hour)
+    cursor.execute('''
+        SELECT hour, bytes_sent, bytes_received, co2_ng, samples FROM hourly_usage
+        WHERE hour >= ? AND hour < ?
+    ''', (first_full_hour, end_hour))
+    for hour, *values in cursor.fetchall():
+        hidden = already_hidden.get(hour, (0, 0, 0, 0))
+        hours[hour] = tuple(value - earlier for value, earlier in zip(values, hidden))
+
+    cursor.execute('INSERT INTO resets (start, end, created, last_rowid) VALUES (?, ?, ?, ?)',
+                   (start_text, end_text, now.strftime('%Y-%m-%d %H:%M:%S'), last_rowid))
+    reset_id = cursor.lastrowid
+    cursor.executemany('''
+        INSERT INTO reset_hours (reset_id, hour, bytes_sent, bytes_received, co2_ng, samples)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(reset_id, hour) + values for hour, values in hours.items() if values[3] > 0])
+    return reset_id
+
+# Function to undo the newest reset maintenance has not purged yet, returns its (start, end) or None
+def undo_last_reset(cursor):
+    cursor.execute('SELECT id, start, end FROM resets WHERE undone = 0 AND purged = 0 ORDER BY id DESC LIMIT 1')
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute('UPDATE resets SET undone = 1 WHERE id = ?', (row[0],))
+    return datetime.datetime.fromisoformat(row[1]), datetime.datetime.fromisoformat(row[2])
+
+# Function to check whether there is a reset left to undo
+def has_undoable_reset(cursor):
+    cursor.execute('SELECT 1 FROM resets WHERE undone = 0 AND purged = 0 LIMIT 1')
+    return cursor.fetchone() is not None
+
+# Function to apply resets made before the cutoff for good: take them out of the rollups and delete their samples
+def purge_resets(conn, cutoff):
+    cursor = conn.cursor()
+    deleted = 0
+    cursor.execute('SELECT id, start, end, last_rowid FROM resets WHERE undone = 0 AND purged = 0 AND created < ? ORDER BY id',
+                   (cutoff.strftime('%Y-%m-%d %H:%M:%S'),))
+    for reset_id, start, end, last_rowid in cursor.fetchall():
+        # One transaction per reset, so readers never see it both subtracted from the rollups and still hiding samples
+        cursor.execute('SELECT hour, bytes_sent, bytes_received, co2_ng, samples FROM reset_hours WHERE reset_id = ?',
+                       (reset_id,))
+        for hour, *values in cursor.fetchall():
+            cursor.execute('''
+                UPDATE hourly_usage SET bytes_sent = bytes_sent - ?, bytes_received = bytes_received - ?,
+                    co2_ng = co2_ng - ?, samples = samples - ?
+                WHERE hour = ?
+            ''', (*values, hour))
+        cursor.execute('DELETE FROM hourly_usage WHERE samples <= 0')
+        cursor.execute('DELETE FROM network_usage WHERE timestamp >= ? AND timestamp < ? AND rowid <= ?', (start, end, last_rowid))
+        deleted += cursor.rowcount
+        cursor.execute('UPDATE resets SET purged = 1 WHERE id = ?', (reset_id,))
+        cursor.execute('DELETE FROM reset_hours WHERE reset_id = ?', (reset_id,))
+        last_day = (datetime.datetime.fromisoformat(end) - datetime.timedelta(seconds=1)).date().isoformat()
+        refresh_daily_summary(cursor, start[:10], last_day)
+        conn.commit()
+
+    # Undone resets hide nothing, only their snapshots are left to drop
+    cursor.execute('DELETE FROM reset_hours WHERE reset_id IN (SELECT id FROM resets WHERE undone = 1)')
+    conn.commit()
+    return deleted
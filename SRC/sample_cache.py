@@ -0,0 +1,163 @@
+import datetime
+import os
+import threading
+
+import numpy as np
+
+# Column order of the cache arrays
+TIMESTAMP, SENT, RECEIVED, CO2 = range(4)  # CO2 in nanograms
+COLUMNS = 4
+RESOLUTION = 10  # Seconds: samples taken closer together than this share one row
+
+# Keeps the last few days of samples as NumPy columns, optionally backed by a memory-mapped file.
+# Samples are merged into rows of at most one per resolution seconds, so the size does not depend on the sampling rate
+class SampleCache:
+    def __init__(self, days=7, resolution=RESOLUTION, spill_path=None):
+        self.window = days * 86400
+        self.resolution = resolution
+        # Twice the window so old samples are dropped in one move instead of on every append
+        self.capacity = 2 * (self.window // resolution + 1)
+        self.lock = threading.Lock()
+        # Everything stored from this epoch time onwards is in the cache
+        self.complete_since = None
+
+        if spill_path:
+            # Reuse the spill file only if it was written with the same window and resolution
+            expected_size = COLUMNS * self.capacity * np.dtype(np.float64).itemsize
+            mode = 'r+' if os.path.exists(spill_path) and os.path.getsize(spill_path) == expected_size else 'w+'
+            self.data = np.memmap(spill_path, dtype=np.float64, mode=mode, shape=(COLUMNS, self.capacity))
+            # Timestamps are increasing and unused slots are zero, so the first zero ends the data
+            empty = np.flatnonzero(self.data[TIMESTAMP] == 0)
+            self.count = int(empty[0]) if empty.size else self.capacity
+        else:
+            self.data = np.zeros((COLUMNS, self.capacity), dtype=np.float64)
+            self.count = 0
+
+    # Function to get the newest cached timestamp as a datetime
+    def last_time(self):
+        if self.count == 0:
+            return None
+        return datetime.datetime.fromtimestamp(self.data[TIMESTAMP, self.count - 1])
+
+    # Function to drop samples older than the window once the arrays are full
+    def _make_room(self, newest):
+        keep_from = int(np.searchsorted(self.data[TIMESTAMP, :self.count], newest - self.window))
+        if keep_from == 0:
+            keep_from = self.count - self.capacity // 2
+        kept = self.count - keep_from
+        self.data[:, :kept] = self.data[:, keep_from:self.count]
+        self.data[:, kept:self.count] = 0
+        self.count = kept
+        if self.complete_since is not None:
+            self.complete_since = max(self.complete_since, self.data[TIMESTAMP, 0])
+
+    # Function to add one stored sample
+    def append(self, when, sent_bytes, recv_bytes, co2_ng):
+        timestamp = when.timestamp()
+        row = (timestamp, sent_bytes, recv_bytes, co2_ng)
+        with self.lock:
+            newest = self.data[TIMESTAMP, self.count - 1] if self.count else None
+            if newest is not None and timestamp >= newest and timestamp // self.resolution == newest // self.resolution:
+                # Same resolution step as the newest row: add to it, stamped with the newer sample's time
+                self.data[TIMESTAMP, self.count - 1] = timestamp
+                self.data[SENT:, self.count - 1] += (sent_bytes, recv_bytes, co2_ng)
+                return
+            if self.count == self.capacity:
+                self._make_room(timestamp)
+            if self.count and timestamp < self.data[TIMESTAMP, self.count - 1]:
+                # Back-filled samples can arrive late, keep the timestamps sorted
+                index = int(np.searchsorted(self.data[TIMESTAMP, :self.count], timestamp, side='right'))
+                self.data[:, index + 1:self.count + 1] = self.data[:, index:self.count].copy()
+                self.data[:, index] = row
+            else:
+                self.data[:, self.count] = row
+            self.count += 1
+
+    # Function to load stored samples newer than the cache from a storage backend
+    def load(self, storage, now=None):
+        now = now or datetime.datetime.now()
+        window_start = now - datetime.timedelta(seconds=self.window)
+        last_time = self.last_time()
+        if last_time is None or last_time < window_start:
+            # Nothing usable from the spill file, read the whole window
+            self.discard_since(datetime.datetime.fromtimestamp(0))
+            since = window_start
+            # Raw samples may have been compacted away for part of the window, so the cache is only
+            # complete from the oldest sample actually read (from now when none are left)
+            complete_since = None
+        else:
+            # Top the spill file up with what was stored since it was last written
+            since = last_time
+            complete_since = self.data[TIMESTAMP, 0]
+
+        for when, sent_bytes, recv_bytes, co2_ng, _ in storage.range_query(since, now + datetime.timedelta(days=1)):
+            if last_time is None or when > last_time:
+                self.append(when, sent_bytes, recv_bytes, co2_ng)
+                if complete_since is None:
+                    complete_since = when.timestamp()
+        if complete_since is None:
+            complete_since = now.timestamp()
+        with self.lock:
+            self.complete_since = complete_since
+
+    # Function to forget samples from a time onwards (after a manual reset)
+    def discard_since(self, start):
+        with self.lock:
+            index = int(np.searchsorted(self.data[TIMESTAMP, :self.count], start.timestamp()))
+            self.data[:, index:self.count] = 0
+            self.count = index
+
+    # Function to check whether the cache holds everything from start onwards
+    def covers(self, start):
+        with self.lock:
+            return self.complete_since is not None and start.timestamp() >= self.complete_since
+
+    def _range(self, start, end):
+        timestamps = self.data[TIMESTAMP, :self.count]
+        first = int(np.searchsorted(timestamps, start.timestamp()))
+        last = int(np.searchsorted(timestamps, end.timestamp()))
+        return first, last
+
+    # Function to copy the columns between start and end
+    def slice(self, start, end):
+        with self.lock:
+            first, last = self._range(start, end)
+            return self.data[:, first:last].copy()
+
+    # Function to total sent bytes, received bytes and nanograms between start and end
+    def aggregate(self, start, end):
+        with self.lock:
+            first, last = self._range(start, end)
+            sent, received, co2_ng = self.data[SENT:, first:last].sum(axis=1)
+        # Whole numbers stay exact in float64 up to 2**53, far above a week of traffic
+        return int(sent), int(received), int(co2_ng)
+
+    # Function to bucket a column between start and end, returns (bucket start times, values)
+    def resample(self, start, end, buckets, column=CO2, how='sum'):
+        with self.lock:
+            first, last = self._range(start, end)
+            timestamps = self.data[TIMESTAMP, first:last]
+            values = self.data[column, first:last]
+
+            bucket_seconds = max((end - start).total_seconds() / buckets, 1)
+            index = ((timestamps - start.timestamp()) // bucket_seconds).astype(np.int64)
+            if how == 'sum':
+                result = np.bincount(index, weights=values, minlength=buckets)[:buckets]
+            else:
+                # Reduce each run of equal bucket indexes, only buckets with samples are returned
+                if index.size == 0:
+                    return np.empty(0), np.empty(0)
+                starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+                reducer = np.maximum if how == 'max' else np.add
+                result = reducer.reduceat(values, starts)
+                if how == 'mean':
+                    result = result / np.diff(np.r_[starts, index.size])
+                return start.timestamp() + index[starts] * bucket_seconds, result
+
+        return start.timestamp() + np.arange(buckets) * bucket_seconds, result
+
+    # Function to write the memory-mapped columns back to disk
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            with self.lock:
+                self.data.flush()
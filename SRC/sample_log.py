@@ -0,0 +1,260 @@
+import datetime
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+from history import RAW_HISTORY_MAX_SPAN, LEGACY_INTERVAL_MS
+from storage import StorageBackend
+from units import nanograms_per_gb, co2_nanograms
+
+MAGIC = b'CO2LOG1\0'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQ')  # magic, version, record size, checkpointed record count
+HEADER_SIZE = 64
+RECORD = np.dtype([('timestamp', '<f8'), ('sent', '<i8'), ('received', '<i8'), ('co2_ng', '<i8'), ('interval_ms', '<i8')])
+GROW_RECORDS = 32768  # File grows by this many records (1.25 MB) at a time
+CHECKPOINT_EVERY = 60  # Records between header and index checkpoints
+
+# Append-only log of fixed-size sample records in a memory-mapped file
+class SampleLog(StorageBackend):
+    def __init__(self, log_path, co2_per_gb):
+        # One log is shared by every thread, unlike SQLite connections
+        self.lock = threading.RLock()
+        self.log_path = log_path
+        self.index_path = log_path + '.idx'
+        self.ng_per_gb = nanograms_per_gb(co2_per_gb)
+
+        if not os.path.exists(log_path):
+            with open(log_path, 'wb') as log_file:
+                log_file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, 0).ljust(HEADER_SIZE, b'\0'))
+                log_file.truncate(HEADER_SIZE + GROW_RECORDS * RECORD.itemsize)
+
+        with open(log_path, 'rb') as log_file:
+            magic, version, record_size, checkpointed = HEADER.unpack(log_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize:
+            raise ValueError(f"{log_path} is not a sample log")
+
+        self._map()
+        self._load_index(checkpointed)
+
+    # Function to map the whole file as an array of records
+    def _map(self):
+        capacity = (os.path.getsize(self.log_path) - HEADER_SIZE) // RECORD.itemsize
+        self.records = np.memmap(self.log_path, dtype=RECORD, mode='r+', offset=HEADER_SIZE, shape=(capacity,))
+
+    # Function to restore the day index from its checkpoint and replay records written after it
+    def _load_index(self, checkpointed):
+        index = {}
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            pass
+
+        if index.get('count') == checkpointed:
+            self.count = checkpointed
+            self.days = {day: list(entry) for day, entry in index['days'].items()}
+            self.totals_bytes = index['totals']
+        else:
+            # No matching checkpoint, rebuild the index from the records
+            self.count = 0
+            self.days = {}
+            self.totals_bytes = [0, 0, 0]
+
+        # Records after the checkpoint were written but not yet checkpointed, a zero timestamp ends them
+        tail = self.records['timestamp'][self.count:]
+        end = self.count + (int(np.argmax(tail == 0)) if (tail == 0).any() else tail.size)
+        start = self.count
+        self.count = end
+        self._index_records(start, end)
+
+    # Function to add records [start, end) to the day index and totals
+    def _index_records(self, start, end):
+        for record in self.records[start:end]:
+            self._index_record(record['timestamp'], int(record['sent']), int(record['received']), int(record['co2_ng']))
+
+    def _index_record(self, timestamp, sent_bytes, recv_bytes, co2_ng):
+        day = datetime.date.fromtimestamp(timestamp).isoformat()
+        entry = self.days.setdefault(day, [0, 0, 0])  # sent bytes, received bytes, nanograms
+        entry[0] += sent_bytes
+        entry[1] += recv_bytes
+        entry[2] += co2_ng
+        if entry[0] == 0 and entry[1] == 0:
+            del self.days[day]
+        self.totals_bytes[0] += sent_bytes
+        self.totals_bytes[1] += recv_bytes
+        self.totals_bytes[2] += co2_ng
+
+    # Function to persist the record count and the day index
+    def checkpoint(self):
+        with self.lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self.records.flush()
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump({'count': self.count, 'days': self.days, 'totals': self.totals_bytes}, index_file)
+        os.replace(temp_path, self.index_path)
+        with open(self.log_path, 'r+b') as log_file:
+            log_file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, self.count))
+
+    # Function to make room for more records
+    def _grow(self, needed):
+        if self.count + needed <= self.records.shape[0]:
+            return
+        self.records.flush()
+        extra = max(GROW_RECORDS, needed)
+        with open(self.log_path, 'r+b') as log_file:
+            log_file.truncate(HEADER_SIZE + (self.records.shape[0] + extra) * RECORD.itemsize)
+        self._map()
+
+    # Function to append (timestamp, sent bytes, received bytes, interval seconds) records, same contract as storage.write_samples
+    def append_samples(self, records, day_total, day):
+        with self.lock:
+            return self._append_samples(records, day_total, day)
+
+    def _append_samples(self, records, day_total, day):
+        # Every record is worked out and the file grown before the first is written, so a bad record
+        # leaves nothing behind to roll back
+        rows = []
+        for when, sent_bytes, recv_bytes, interval in records:
+            sent_bytes, recv_bytes = round(sent_bytes), round(recv_bytes)
+            rows.append((when, when.timestamp(), sent_bytes, recv_bytes,
+                         co2_nanograms(sent_bytes + recv_bytes, self.ng_per_gb), round(interval * 1000)))
+        self._grow(len(rows))
+
+        stored = []
+        for when, timestamp, sent_bytes, recv_bytes, co2_ng, interval_ms in rows:
+            if self.count and timestamp < self.records['timestamp'][self.count - 1]:
+                # Keep the log sorted; late records are rare so shifting the tail is acceptable
+                index = int(np.searchsorted(self.records['timestamp'][:self.count], timestamp, side='right'))
+                self.records[index + 1:self.count + 1] = self.records[index:self.count].copy()
+                self.records[index] = (timestamp, sent_bytes, recv_bytes, co2_ng, interval_ms)
+            else:
+                self.records[self.count] = (timestamp, sent_bytes, recv_bytes, co2_ng, interval_ms)
+            self.count += 1
+            self._index_record(timestamp, sent_bytes, recv_bytes, co2_ng)
+
+            if when.date() > day:
+                day_total = 0
+                day = when.date()
+            if when.date() == day:
+                day_total += co2_ng
+            stored.append((when, co2_ng, sent_bytes + recv_bytes))
+
+        if self.count % CHECKPOINT_EVERY < len(records):
+            try:
+                self._checkpoint()
+            except OSError:
+                # The records are in the mapped file already, loading replays everything after the last checkpoint
+                pass
+        return day_total, day, stored
+
+    # Function to get a zero-copy view of the records between start and end
+    def view(self, start, end):
+        with self.lock:
+            first, last = self._range(start, end)
+            return self.records[first:last]
+
+    def _range(self, start, end):
+        timestamps = self.records['timestamp'][:self.count]
+        first = int(np.searchsorted(timestamps, start.timestamp()))
+        last = int(np.searchsorted(timestamps, end.timestamp())) if end else self.count
+        return first, last
+
+    def range_query(self, start, end):
+        records = self.view(start, end)
+        return [(datetime.datetime.fromtimestamp(r['timestamp']), int(r['sent']), int(r['received']), int(r['co2_ng']),
+                 int(r['interval_ms'])) for r in records]
+
+    # Function to fetch (datetime, nanograms) chart points like history.fetch_history
+    def history(self, start, end):
+        records = self.view(start, end)
+        if end - start > RAW_HISTORY_MAX_SPAN and records.size:
+            # Longer spans are summed per hour, matching the hourly rollups
+            hours = (records['timestamp'] // 3600).astype(np.int64)
+            starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+            co2_ng = np.add.reduceat(records['co2_ng'], starts)
+            return [(datetime.datetime.fromtimestamp(hour * 3600), int(ng)) for hour, ng in zip(hours[starts], co2_ng)]
+        return [(datetime.datetime.fromtimestamp(t), int(ng)) for t, ng in zip(records['timestamp'], records['co2_ng'])]
+
+    # Function to read (hour, nanograms, seconds covered by samples) per hour, like StorageBackend.hourly_coverage
+    def hourly_coverage(self, start, end):
+        records = self.view(start, end)
+        if records.size == 0:
+            return []
+        hours = (records['timestamp'] // 3600).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+        co2_ng = np.add.reduceat(records['co2_ng'], starts)
+        interval_ms = np.add.reduceat(np.where(records['interval_ms'] > 0, records['interval_ms'], LEGACY_INTERVAL_MS), starts)
+        return [(datetime.datetime.fromtimestamp(hour * 3600), int(ng), int(ms) / 1000)
+                for hour, ng, ms in zip(hours[starts], co2_ng, interval_ms)]
+
+    def aggregate(self, start, end):
+        records = self.view(start, end)
+        return int(records['sent'].sum()), int(records['received'].sum()), int(records['co2_ng'].sum())
+
+    # Function to read the all-time totals in bytes from the index
+    def totals(self):
+        with self.lock:
+            sent, received, _ = self.totals_bytes
+        return sent, received, sent + received
+
+    # Function to read a day's CO2 nanograms from the index
+    def day_usage(self, day):
+        with self.lock:
+            entry = self.days.get(day)
+            return entry[2] if entry else 0
+
+    # Function to read (date, nanograms) for every day from the index
+    def daily_totals(self):
+        with self.lock:
+            return [(datetime.date.fromisoformat(day), entry[2]) for day, entry in self.days.items()]
+
+    # Function to summarize one day from its records (about 1440 at one sample per minute)
+    def day_summary(self, day):
+        start = datetime.datetime.combine(datetime.date.fromisoformat(day), datetime.time.min)
+        with self.lock:
+            records = self.view(start, start + datetime.timedelta(days=1)).copy()
+        if records.size == 0:
+            return None
+        sent = int(records['sent'].sum())
+        received = int(records['received'].sum())
+        return {
+            'bytes_sent': sent,
+            'bytes_received': received,
+            'total_bytes': sent + received,
+            'co2_ng': int(records['co2_ng'].sum()),
+            'samples': int(records.size),
+            'peak_bytes_per_second': float(((records['sent'] + records['received']) * 1000
+                                            / np.where(records['interval_ms'] > 0, records['interval_ms'], LEGACY_INTERVAL_MS)).max()),
+            'first_sample': datetime.datetime.fromtimestamp(records['timestamp'][0]),
+            'last_sample': datetime.datetime.fromtimestamp(records['timestamp'][-1]),
+        }
+
+    # Function to drop records in [start, end), closing the hole by moving the later records down
+    def delete_range(self, start, end=None):
+        with self.lock:
+            first, last = self._range(start, end)
+            removed = self.records[first:last].copy()
+            moved = self.count - last
+            self.records[first:first + moved] = self.records[last:self.count].copy()
+            self.records[first + moved:self.count] = 0
+            self.count = first + moved
+            for record in removed:
+                self._index_record(record['timestamp'], -int(record['sent']), -int(record['received']), -int(record['co2_ng']))
+            self._checkpoint()
+
+    def commit(self):
+        # Records are already in the mapped file; the header and index follow every CHECKPOINT_EVERY records
+        pass
+
+    # Function to checkpoint and release the file
+    def close(self):
+        with self.lock:
+            self._checkpoint()
+            del self.records
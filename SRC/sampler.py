@@ -0,0 +1,149 @@
+import datetime
+import time
+
+SAMPLE_INTERVAL = 60  # Seconds between counter readings
+GAP_FACTOR = 2  # An interval longer than this many sample periods is a gap (sleep, hibernate, stall)
+BOOT_TIME_TOLERANCE = 5  # Seconds of jitter allowed when comparing boot times
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+# Adaptive sampling: a rate change above BURST_CHANGE of the larger rate speeds sampling up,
+# one below FLAT_CHANGE slows it down; rates under ACTIVE_BYTES_PER_SECOND count as idle noise
+BURST_CHANGE = 0.5
+FLAT_CHANGE = 0.2
+ACTIVE_BYTES_PER_SECOND = 16 * 1024
+SPEED_UP = 4
+BACK_OFF = 1.5
+HOUR_EDGE_SECONDS = 1  # Wake this long before the hour so a sample never straddles it
+POWER_CHECK_SECONDS = 60
+
+# Function to read elapsed time including suspend, where the OS offers such a clock
+def suspend_aware_clock():
+    # CLOCK_BOOTTIME keeps counting while a Linux machine sleeps; elsewhere monotonic already does
+    if hasattr(time, 'CLOCK_BOOTTIME'):
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+    return time.monotonic()
+
+# Function to split a traffic delta evenly over the hours between start and end, in whole bytes
+def spread_over_hours(start, end, sent_bytes, recv_bytes):
+    total = (end - start) // MICROSECOND
+    if total <= 0:
+        return [(end, sent_bytes, recv_bytes, 0)]
+
+    records = []
+    chunk_start = start
+    sent_done = recv_done = 0
+    while chunk_start < end:
+        next_hour = chunk_start.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+        chunk_end = min(next_hour, end)
+        # Cut at the running share so the chunks add up to exactly the delta
+        elapsed = (chunk_end - start) // MICROSECOND
+        sent_upto = sent_bytes * elapsed // total
+        recv_upto = recv_bytes * elapsed // total
+        # Stamp each chunk inside its own hour so the hourly rollups stay accurate
+        stamp = chunk_end if chunk_end == end else chunk_end - datetime.timedelta(seconds=1)
+        records.append((stamp, sent_upto - sent_done, recv_upto - recv_done, (chunk_end - chunk_start).total_seconds()))
+        sent_done, recv_done = sent_upto, recv_upto
+        chunk_start = chunk_end
+    return records
+
+# Turns cumulative OS counters into per-interval (timestamp, sent bytes, received bytes, interval seconds) records
+class Sampler:
+    def __init__(self, clock=suspend_aware_clock, wall_clock=datetime.datetime.now, interval=SAMPLE_INTERVAL):
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.interval = interval
+        self.last_sent = None
+        self.last_recv = None
+        self.last_clock = None
+
+    # Function to set the baselines, back-filling traffic since the last run when it can be recovered
+    def start(self, sent, recv, state=None, boot_time=None):
+        now = self.wall_clock()
+        records = []
+        state = state or {}
+
+        if state.get('last_sample_time') and boot_time is not None and state.get('boot_time') is not None:
+            last_time = datetime.datetime.fromisoformat(state['last_sample_time'])
+            same_boot = abs(state['boot_time'] - boot_time) <= BOOT_TIME_TOLERANCE
+            if same_boot and sent >= state['last_sent'] and recv >= state['last_recv']:
+                # Same boot, the counters carried on while the app was closed
+                records = spread_over_hours(last_time, now, sent - state['last_sent'], recv - state['last_recv'])
+            elif not same_boot:
+                # The machine rebooted, counters started from zero at boot
+                boot = datetime.datetime.fromtimestamp(boot_time)
+                records = spread_over_hours(max(boot, last_time), now, sent, recv)
+
+        self.last_sent, self.last_recv = sent, recv
+        self.last_clock = self.clock()
+        return [record for record in records if record[1] or record[2]]
+
+    # Function to turn a new counter reading into records, spreading gaps over the hours they cover
+    def sample(self, sent, recv):
+        now = self.wall_clock()
+        now_clock = self.clock()
+        elapsed = now_clock - self.last_clock
+
+        # Counters can drop when an interface goes away; start a new baseline instead of going negative
+        sent_bytes = max(sent - self.last_sent, 0)
+        recv_bytes = max(recv - self.last_recv, 0)
+        self.last_sent, self.last_recv = sent, recv
+        self.last_clock = now_clock
+
+        # The scheduler updates self.interval, so a gap is judged against the interval it asked for
+        if elapsed > GAP_FACTOR * self.interval:
+            return spread_over_hours(now - datetime.timedelta(seconds=elapsed), now, sent_bytes, recv_bytes)
+        return [(now, sent_bytes, recv_bytes, elapsed)]
+
+# Picks the time until the next counter reading: sub-second during bursts, minutes while traffic is flat
+class AdaptiveScheduler:
+    def __init__(self, min_interval=0.5, max_interval=300, interval=SAMPLE_INTERVAL, battery_cpu_percent=0.5,
+                 battery_wakeups_per_minute=4, on_battery=None, clock=time.monotonic):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = interval
+        # Budgets that only apply on battery: share of one core spent sampling, and timer wakeups
+        self.battery_cpu_percent = battery_cpu_percent
+        self.battery_wakeups_per_minute = battery_wakeups_per_minute
+        self.on_battery = on_battery
+        self.clock = clock
+        self.last_rate = None
+        self.battery = False
+        self.power_checked = None
+
+    # Function to check the power source, at most once every POWER_CHECK_SECONDS
+    def _check_power(self):
+        now = self.clock()
+        if self.on_battery and (self.power_checked is None or now - self.power_checked >= POWER_CHECK_SECONDS):
+            self.power_checked = now
+            try:
+                self.battery = bool(self.on_battery())
+            except Exception:
+                self.battery = False
+        return self.battery
+
+    # Function to pick the next interval from the traffic just measured and the CPU time spent handling it
+    def next_interval(self, total_bytes, elapsed, busy_seconds, now):
+        rate = total_bytes / elapsed if elapsed > 0 else 0
+        if self.last_rate is not None:
+            # Scale-free change in throughput, ignoring jitter while the link is practically idle
+            change = abs(rate - self.last_rate) / max(rate, self.last_rate, ACTIVE_BYTES_PER_SECOND)
+            if change > BURST_CHANGE:
+                self.interval /= SPEED_UP
+            elif change < FLAT_CHANGE:
+                self.interval *= BACK_OFF
+        self.last_rate = rate
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+
+        interval = self.interval
+        if self._check_power():
+            cpu_share = self.battery_cpu_percent / 100
+            if cpu_share > 0:
+                interval = max(interval, busy_seconds / cpu_share)
+            if self.battery_wakeups_per_minute > 0:
+                interval = max(interval, 60 / self.battery_wakeups_per_minute)
+
+        # Read just before the hour rather than after it, so each sample's traffic is stored in its own hour
+        seconds_left = 3600 - (now.minute * 60 + now.second + now.microsecond / 1_000_000)
+        if seconds_left <= 2 * HOUR_EDGE_SECONDS:
+            seconds_left += 3600  # This reading closed the hour, aim for the end of the next one
+        return min(interval, seconds_left - HOUR_EDGE_SECONDS)
@@ -6,7 +6,7 @@ DATA_FILES = [
 ]
 OPTIONS = {
     'argv_exe': 'co2_tracker.py',
-    'packages': ['matplotlib', 'PIL', 'psutil', 'tkinter', 'sqlite3', 'webbrowser'],
+    'packages': ['matplotlib', 'numpy', 'PIL', 'psutil', 'tkinter', 'sqlite3', 'webbrowser'],
 }
 
 setup(
@@ -14,6 +14,8 @@ setup(
     data_files=DATA_FILES,
     options={'build_exe': OPTIONS},
     setup_requires=['py2app'],
+    # NumPy backs the sample cache, which every storage engine uses
+    install_requires=['matplotlib', 'numpy', 'Pillow', 'psutil'],
     name='Internet Carbon Tracker',
     version='0.1',
     description='Track your internet usage and carbon emissions.',
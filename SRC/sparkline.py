@@ -0,0 +1,98 @@
+import tkinter as tk
+
+MARGIN = 8  # Pixels between the plot and the canvas edge
+LABEL_HEIGHT = 18  # Pixels reserved above and below the plot for the title and axis labels
+
+# Draws a line chart straight onto a Tk canvas; each update moves the points of the same items
+# instead of rendering a new image, so matplotlib is not needed
+class Sparkline:
+    def __init__(self, master, width=430, height=220, color='blue', average_color='green', unit='g'):
+        self.unit = unit  # Shown with the top of the y axis
+        self.canvas = tk.Canvas(master, width=width, height=height, bg='white', highlightthickness=0)
+        self.title = self.canvas.create_text(MARGIN, MARGIN, anchor='nw', font=("Segoe", 10, 'bold'))
+        self.top_label = self.canvas.create_text(0, 0, anchor='ne', font=("Segoe", 8), fill='gray')
+        self.left_label = self.canvas.create_text(0, 0, anchor='nw', font=("Segoe", 8), fill='gray')
+        self.right_label = self.canvas.create_text(0, 0, anchor='ne', font=("Segoe", 8), fill='gray')
+        self.legend = self.canvas.create_text(0, 0, anchor='ne', font=("Segoe", 8), fill=average_color)
+        self.baseline = self.canvas.create_line(0, 0, 0, 0, fill='gray')
+        self.average_line = self.canvas.create_line(0, 0, 0, 0, fill=average_color, dash=(4, 2), state=tk.HIDDEN)
+        self.line = self.canvas.create_line(0, 0, 0, 0, fill=color, width=1.5, state=tk.HIDDEN)
+        self.points = []
+        self.x_range = (0, 1)
+        self.average = None
+        # Redraw at the new size when the canvas is resized
+        self.canvas.bind('<Configure>', lambda e: self._draw())
+
+    # Function to show (x, y) points over x_range, with an optional dashed average line and labels
+    def plot(self, points, x_range, average=None, title='', legend='', x_labels=('', '')):
+        self.points = points
+        self.x_range = x_range
+        self.average = average
+        self.canvas.itemconfigure(self.title, text=title)
+        self.canvas.itemconfigure(self.legend, text=legend)
+        self.canvas.itemconfigure(self.left_label, text=x_labels[0])
+        self.canvas.itemconfigure(self.right_label, text=x_labels[1])
+        self._draw()
+
+    # Function to move the items to the current points and canvas size
+    def _draw(self):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width <= 1:
+            # Not laid out yet, use the requested size
+            width, height = int(self.canvas['width']), int(self.canvas['height'])
+        left, right = MARGIN, width - MARGIN
+        top, bottom = MARGIN + LABEL_HEIGHT, height - MARGIN - LABEL_HEIGHT
+
+        y_max = max([y for _, y in self.points] + [self.average or 0]) or 1
+        x_start, x_end = self.x_range
+        x_scale = (right - left) / ((x_end - x_start) or 1)
+        y_scale = (bottom - top) / y_max
+
+        self.canvas.coords(self.baseline, left, bottom, right, bottom)
+        self.canvas.coords(self.top_label, right, MARGIN)
+        self.canvas.itemconfigure(self.top_label, text=f"max {y_max:.2f} {self.unit}")
+        self.canvas.coords(self.left_label, left, bottom + 2)
+        self.canvas.coords(self.right_label, right, bottom + 2)
+        self.canvas.coords(self.legend, right, MARGIN + LABEL_HEIGHT)
+
+        if self.points:
+            coords = []
+            for x, y in self.points:
+                coords += (left + (x - x_start) * x_scale, bottom - y * y_scale)
+            if len(coords) == 2:
+                coords += coords  # A line needs two points
+            self.canvas.coords(self.line, *coords)
+            self.canvas.itemconfigure(self.line, state=tk.NORMAL)
+        else:
+            self.canvas.itemconfigure(self.line, state=tk.HIDDEN)
+
+        if self.average is not None:
+            y = bottom - self.average * y_scale
+            self.canvas.coords(self.average_line, left, y, right, y)
+            self.canvas.itemconfigure(self.average_line, state=tk.NORMAL)
+        else:
+            self.canvas.itemconfigure(self.average_line, state=tk.HIDDEN)
+
+# Calls a function on the Tk main loop every interval milliseconds; stands in for matplotlib's
+# FuncAnimation, including its pause() and resume()
+class Ticker:
+    def __init__(self, root, func, interval):
+        self.root = root
+        self.func = func
+        self.interval = interval
+        self.job = root.after(interval, self._tick)
+
+    def _tick(self):
+        # Schedule first, so an error in func does not stop the ticks
+        self.job = self.root.after(self.interval, self._tick)
+        self.func(None)
+
+    def pause(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+
+    def resume(self):
+        if self.job is None:
+            self.job = self.root.after(self.interval, self._tick)
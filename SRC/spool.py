@@ -0,0 +1,160 @@
+import json
+import os
+import struct
+import threading
+import zlib
+
+ENTRY = struct.Struct('<II')  # payload length, CRC-32 of the payload
+SAMPLE = struct.Struct('<dqq')  # epoch seconds, sent bytes, received bytes
+SEGMENT_SUFFIX = '.seg'
+
+# Disk-backed queue of samples waiting for upload, kept in checksummed segment files
+class Spool:
+    def __init__(self, directory, segment_bytes=1024 * 1024, max_bytes=64 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes  # Oldest segments are dropped, even unsent, beyond this
+        self.cursor_path = os.path.join(directory, 'cursor.json')
+        self.lock = threading.Lock()
+        self.stats = {'dropped_segments': 0, 'dropped_samples': 0, 'corrupt_entries': 0}
+        self.on_append = None  # Called after every append, from the appending thread
+
+        self.sizes = {}
+        for name in os.listdir(directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                self.sizes[int(name[:-len(SEGMENT_SUFFIX)])] = os.path.getsize(os.path.join(directory, name))
+        if not self.sizes:
+            open(self._path(1), 'ab').close()
+            self.sizes[1] = 0
+        self.active = max(self.sizes)
+
+        # A crash can leave a partial entry at the end of the newest segment, cut it off before appending
+        valid_end = self._scan(self.active, 0)[1]
+        if valid_end != self.sizes[self.active]:
+            with open(self._path(self.active), 'r+b') as segment_file:
+                segment_file.truncate(valid_end)
+            self.sizes[self.active] = valid_end
+        self.file = open(self._path(self.active), 'ab')
+
+        self.cursor = self._load_cursor()
+        self.unread = self._count_unread()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f'{segment:012d}{SEGMENT_SUFFIX}')
+
+    # Function to read the upload position, starting at the oldest segment if it is missing or evicted
+    def _load_cursor(self):
+        try:
+            with open(self.cursor_path) as cursor_file:
+                segment, offset = json.load(cursor_file)
+        except (OSError, ValueError, TypeError):
+            return min(self.sizes), 0
+        if segment not in self.sizes:
+            later = [number for number in self.sizes if number > segment]
+            return (min(later), 0) if later else (self.active, self.sizes[self.active])
+        return segment, min(offset, self.sizes[segment])
+
+    # Function to walk a segment's entries from offset, returns (samples, end of the last valid entry)
+    def _scan(self, segment, offset, max_samples=None, decode=False):
+        samples = []
+        count = 0
+        with open(self._path(segment), 'rb') as segment_file:
+            segment_file.seek(offset)
+            while max_samples is None or count < max_samples:
+                header = segment_file.read(ENTRY.size)
+                if len(header) < ENTRY.size:
+                    break
+                length, checksum = ENTRY.unpack(header)
+                payload = segment_file.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum or length % SAMPLE.size:
+                    # Torn or damaged entry, nothing after it in this segment can be trusted
+                    if decode:
+                        self.stats['corrupt_entries'] += 1
+                    break
+                if decode:
+                    samples.extend(SAMPLE.iter_unpack(payload))
+                count += length // SAMPLE.size
+                offset += ENTRY.size + length
+        return (samples if decode else count), offset
+
+    def _count_unread(self):
+        segment, offset = self.cursor
+        return sum(self._scan(number, offset if number == segment else 0)[0] for number in self.sizes if number >= segment)
+
+    # Function to append stored (datetime, sent bytes, received bytes, interval) records as one checksummed entry;
+    # the collector has no use for the interval, so it is not spooled
+    def append(self, records):
+        if not records:
+            return
+        payload = b''.join(SAMPLE.pack(when.timestamp(), round(sent_bytes), round(recv_bytes))
+                           for when, sent_bytes, recv_bytes, _ in records)
+        entry = ENTRY.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            if self.sizes[self.active] and self.sizes[self.active] + len(entry) > self.segment_bytes:
+                # Start a new segment so whole old segments can be deleted once sent or evicted
+                self.file.close()
+                self.active += 1
+                self.sizes[self.active] = 0
+                self.file = open(self._path(self.active), 'ab')
+            self.file.write(entry)
+            self.file.flush()
+            self.sizes[self.active] += len(entry)
+            self.unread += len(records)
+            self._evict()
+        if self.on_append:
+            self.on_append()
+
+    # Function to drop the oldest segments while the spool is over its size limit
+    def _evict(self):
+        while sum(self.sizes.values()) > self.max_bytes and len(self.sizes) > 1:
+            oldest = min(self.sizes)
+            segment, offset = self.cursor
+            if oldest >= segment:
+                lost = self._scan(oldest, offset if oldest == segment else 0)[0]
+                self.unread -= lost
+                self.stats['dropped_samples'] += lost
+                self.cursor = (min(number for number in self.sizes if number > oldest), 0)
+            del self.sizes[oldest]
+            os.remove(self._path(oldest))
+            self.stats['dropped_segments'] += 1
+
+    # Function to read up to about max_samples unsent samples, returns (epoch samples, position after them)
+    def read(self, max_samples):
+        with self.lock:
+            segment, offset = self.cursor
+            samples = []
+            for number in sorted(self.sizes):
+                if number < segment or len(samples) >= max_samples:
+                    continue
+                start = offset if number == segment else 0
+                found, end = self._scan(number, start, max_samples - len(samples), decode=True)
+                samples.extend(found)
+                segment, offset = number, end
+                if end < self.sizes[number] and len(samples) < max_samples:
+                    # Skip the damaged remainder of this segment, the uploader acks past it
+                    segment, offset = number, self.sizes[number]
+            return samples, (segment, offset)
+
+    # Function to mark everything before position as uploaded and delete finished segments
+    def ack(self, position, samples):
+        with self.lock:
+            segment, offset = position
+            if segment not in self.sizes or position < self.cursor:
+                return  # Evicted or already acknowledged while the upload was in flight
+            self.cursor = position
+            self.unread = max(self.unread - samples, 0)
+            if position == (self.active, self.sizes[self.active]):
+                self.unread = 0  # Caught up, this also forgets samples lost to damaged entries
+            for number in [number for number in self.sizes if number < segment]:
+                del self.sizes[number]
+                os.remove(self._path(number))
+
+            temp_path = self.cursor_path + '.tmp'
+            with open(temp_path, 'w') as cursor_file:
+                json.dump([segment, offset], cursor_file)
+            os.replace(temp_path, self.cursor_path)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,39 @@
+import json
+import os
+
+# Small JSON checkpoint of the sampler's accumulators, replaced atomically on every save
+class StateStore:
+    def __init__(self, state_path):
+        self.state_path = state_path
+
+    # Function to read the last checkpoint, empty if there is none or it is unreadable
+    def load(self):
+        try:
+            with open(self.state_path) as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    # Function to write a checkpoint without ever leaving a half-written file behind
+    def save(self, state):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self.state_path)
+
+# Function to get the state file path
+def get_state_path():
+    return os.path.join(os.path.expanduser('~'), 'Documents', 'CO2_Tracker', 'state.json')
+
+# Function to read a day's CO2 nanograms from its summary row (one primary key lookup), less what resets hide
+def load_day_usage(cursor, day):
+    cursor.execute('''
+        SELECT co2_ng - IFNULL((
+            SELECT SUM(reset_hours.co2_ng) FROM reset_hours JOIN resets ON resets.id = reset_hours.reset_id
+            WHERE resets.undone = 0 AND resets.purged = 0 AND reset_hours.hour >= ? AND reset_hours.hour < ?
+        ), 0)
+        FROM daily_summary WHERE day = ?
+    ''', (day, day + '~', day))
+    result = cursor.fetchone()
+    return result[0] if result else 0
@@ -0,0 +1,364 @@
+import abc
+import bisect
+import datetime
+
+from history import (bytes_per_second, init_history_tables, add_to_hourly_usage, add_to_daily_summary, refresh_daily_summary, fetch_day_summary,
+                     fetch_history, fetch_hourly_coverage, load_hidden_hours, table_has_column, LEGACY_INTERVAL_MS, RAW_HIDDEN_BY_RESET,
+                     RAW_HISTORY_MAX_SPAN)
+from resets import init_reset_tables, record_reset, undo_last_reset
+from state_store import load_day_usage
+from units import BYTES_PER_MB, BYTES_PER_GB, nanograms_per_gb, co2_nanograms
+
+# Function to create the sample, start date and rollup tables
+def init_usage_tables(cursor, co2_per_gb):
+    # Upgrading a database from the versions that stored MB and grams renames and copies tables;
+    # the savepoint makes it all-or-nothing so an interrupted start never leaves half-converted tables
+    cursor.execute('SAVEPOINT init_usage_tables')
+    legacy_samples = table_has_column(cursor, 'network_usage', 'data_sent')
+    if legacy_samples:
+        cursor.execute('ALTER TABLE network_usage RENAME TO network_usage_mb')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS network_usage (
+            timestamp TEXT,
+            bytes_sent INTEGER,
+            bytes_received INTEGER,
+            co2_ng INTEGER,
+            interval_ms INTEGER
+        )
+    ''')
+    if legacy_samples:
+        # The old samples were taken once a minute and get no interval (NULL, read as LEGACY_INTERVAL_MS)
+        cursor.execute('''
+            INSERT INTO network_usage (rowid, timestamp, bytes_sent, bytes_received, co2_ng)
+            SELECT id, timestamp, sent, received, CAST((sent + received) * ? / ? AS INTEGER)
+            FROM (
+                SELECT rowid AS id, timestamp, CAST(ROUND(IFNULL(data_sent, 0) * ?) AS INTEGER) AS sent,
+                       CAST(ROUND(IFNULL(data_received, 0) * ?) AS INTEGER) AS received
+                FROM network_usage_mb
+            )
+        ''', (nanograms_per_gb(co2_per_gb), BYTES_PER_GB, BYTES_PER_MB, BYTES_PER_MB))
+        cursor.execute('DROP TABLE network_usage_mb')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS start_date (
+            start_date TEXT
+        )
+    ''')
+    init_reset_tables(cursor)
+    init_history_tables(cursor)
+    cursor.execute('RELEASE init_usage_tables')
+
+# Function to write (timestamp, sent bytes, received bytes, interval seconds) records and their rollups
+# Returns the updated (day total in nanograms, day) and a (timestamp, nanograms, total bytes) entry per record
+def write_samples(cursor, records, co2_per_gb, day_total, day):
+    ng_per_gb = nanograms_per_gb(co2_per_gb)
+    stored = []
+    for when, sent_bytes, recv_bytes, interval in records:
+        sent_bytes, recv_bytes = round(sent_bytes), round(recv_bytes)
+        total_bytes = sent_bytes + recv_bytes
+
+        # Calculate CO2 emissions for this session
+        co2_ng = co2_nanograms(total_bytes, ng_per_gb)
+
+        # Update the daily usage, starting over on the first sample of a new day
+        if when.date() > day:
+            day_total = 0
+            day = when.date()
+        if when.date() == day:
+            day_total += co2_ng
+
+        # Store network usage in the database
+        timestamp = when.strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute('''
+            INSERT INTO network_usage (timestamp, bytes_sent, bytes_received, co2_ng, interval_ms)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (timestamp, sent_bytes, recv_bytes, co2_ng, round(interval * 1000)))
+        add_to_hourly_usage(cursor, timestamp, sent_bytes, recv_bytes, co2_ng, round(interval * 1000))
+        add_to_daily_summary(cursor, timestamp, sent_bytes, recv_bytes, co2_ng, round(interval * 1000))
+        stored.append((when, co2_ng, total_bytes))
+    return day_total, day, stored
+
+# Function to read the all-time (sent, received, total) bytes from the hourly rollups, less what resets hide
+def load_usage_totals(cursor):
+    cursor.execute('SELECT SUM(bytes_sent), SUM(bytes_received) FROM hourly_usage')
+    result = cursor.fetchone()
+    cursor.execute('''
+        SELECT SUM(reset_hours.bytes_sent), SUM(reset_hours.bytes_received)
+        FROM reset_hours JOIN resets ON resets.id = reset_hours.reset_id
+        WHERE resets.undone = 0 AND resets.purged = 0
+    ''')
+    hidden = cursor.fetchone()
+    sent, received = ((total or 0) - (removed or 0) for total, removed in zip(result, hidden))
+    return sent, received, sent + received
+
+# Function to delete the samples and rollups from a day (YYYY-MM-DD) onwards
+def delete_usage_since(cursor, day):
+    cursor.execute('DELETE FROM network_usage WHERE timestamp >= ?', (day,))
+    cursor.execute('DELETE FROM hourly_usage WHERE hour >= ?', (day,))
+    cursor.execute('DELETE FROM daily_summary WHERE day >= ?', (day,))
+
+# Function to delete samples in [start, end) and take them out of the hourly rollups
+def delete_usage_range(cursor, start, end=None):
+    start_text = start.strftime('%Y-%m-%d %H:%M:%S')
+    end_text = end.strftime('%Y-%m-%d %H:%M:%S') if end else '9999'
+    start_hour = start.replace(minute=0, second=0, microsecond=0)
+    if start_hour != start:
+        start_hour += datetime.timedelta(hours=1)
+    first_full_hour = start_hour.strftime('%Y-%m-%d %H:%M:%S')
+    end_hour = end_text[:13] + ':00:00' if end else end_text
+
+    # Hours only partly inside the range lose just the deleted samples
+    cursor.execute('''
+        SELECT substr(timestamp, 1, 13) || ':00:00', SUM(bytes_sent), SUM(bytes_received), SUM(co2_ng), COUNT(*)
+        FROM network_usage
+        WHERE timestamp >= ? AND timestamp < ? AND (timestamp < ? OR timestamp >= ?)
+        GROUP BY substr(timestamp, 1, 13)
+    ''', (start_text, end_text, first_full_hour, end_hour))
+    for hour, *values in cursor.fetchall():
+        cursor.execute('''
+            UPDATE hourly_usage SET bytes_sent = bytes_sent - ?, bytes_received = bytes_received - ?,
+                co2_ng = co2_ng - ?, samples = samples - ?
+            WHERE hour = ?
+        ''', (*values, hour))
+
+    # Whole hours go, including ones whose raw samples were already compacted
+    cursor.execute('DELETE FROM hourly_usage WHERE hour >= ? AND hour < ?', (first_full_hour, end_hour))
+    cursor.execute('DELETE FROM hourly_usage WHERE samples <= 0')
+    cursor.execute('DELETE FROM network_usage WHERE timestamp >= ? AND timestamp < ?', (start_text, end_text))
+
+    # Days touched by the range are summed again from what is left of their hours
+    last_day = (end - datetime.timedelta(microseconds=1)).date().isoformat() if end else '~'
+    refresh_daily_summary(cursor, start.date().isoformat(), last_day)
+
+# Interface every storage engine implements; records are (timestamp, sent bytes, received bytes, interval seconds),
+# figures come back as whole bytes and nanograms of CO2. An engine missing a method fails when it is created
+class StorageBackend(abc.ABC):
+    supports_undo = False  # Whether reset() can be undone
+
+    # Function to store records, same contract as write_samples
+    @abc.abstractmethod
+    def append_samples(self, records, day_total, day):
+        ...
+
+    # Function to read raw samples in [start, end) as (timestamp, sent bytes, received bytes, nanograms, interval milliseconds)
+    @abc.abstractmethod
+    def range_query(self, start, end):
+        ...
+
+    # Function to read (timestamp, nanograms) chart points in [start, end), hourly sums for spans over RAW_HISTORY_MAX_SPAN
+    @abc.abstractmethod
+    def history(self, start, end):
+        ...
+
+    # Function to read (hour, nanograms, seconds covered by samples) for every hour with samples in [start, end)
+    def hourly_coverage(self, start, end):
+        hours = {}
+        for when, _, _, co2_ng, interval_ms in self.range_query(start, end):
+            hour = when.replace(minute=0, second=0, microsecond=0)
+            total_ng, total_ms = hours.get(hour, (0, 0))
+            hours[hour] = (total_ng + co2_ng, total_ms + (interval_ms or LEGACY_INTERVAL_MS))
+        return [(hour, co2_ng, interval_ms / 1000) for hour, (co2_ng, interval_ms) in sorted(hours.items())]
+
+    # Function to total (sent bytes, received bytes, nanograms) in [start, end)
+    @abc.abstractmethod
+    def aggregate(self, start, end):
+        ...
+
+    # Function to delete samples in [start, end), or everything from start when end is None
+    @abc.abstractmethod
+    def delete_range(self, start, end=None):
+        ...
+
+    # Function to read the all-time (sent, received, total) bytes
+    @abc.abstractmethod
+    def totals(self):
+        ...
+
+    # Function to read a day's (YYYY-MM-DD) CO2 nanograms
+    @abc.abstractmethod
+    def day_usage(self, day):
+        ...
+
+    # Function to read (date, nanograms) for every stored day
+    @abc.abstractmethod
+    def daily_totals(self):
+        ...
+
+    # Function to read a day's summary (bytes, nanograms, sample count, peak bytes per second, first and last sample), None if empty
+    @abc.abstractmethod
+    def day_summary(self, day):
+        ...
+
+    # Function to hide samples in [start, end) until maintenance deletes them; engines without resets delete right away
+    def reset(self, start, end):
+        self.delete_range(start, end)
+
+    # Function to undo the newest reset, returns its (start, end) or None when there is nothing to undo
+    def undo_reset(self):
+        return None
+
+    def commit(self):
+        pass
+
+    # Function to drop everything appended since the last commit, so a failed batch can be stored again
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+# The default engine: raw samples plus hourly rollups in co2_usage.db
+class SQLiteBackend(StorageBackend):
+    supports_undo = True
+
+    def __init__(self, conn, co2_per_gb):
+        self.conn = conn
+        self.co2_per_gb = co2_per_gb
+
+    def append_samples(self, records, day_total, day):
+        return write_samples(self.conn.cursor(), records, self.co2_per_gb, day_total, day)
+
+    def range_query(self, start, end):
+        cursor = self.conn.execute(f'''
+            SELECT timestamp, bytes_sent, bytes_received, co2_ng, interval_ms FROM network_usage
+            WHERE timestamp >= ? AND timestamp < ? AND NOT {RAW_HIDDEN_BY_RESET} ORDER BY timestamp
+        ''', (start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')))
+        return [(datetime.datetime.fromisoformat(timestamp), sent or 0, received or 0, co2_ng or 0, interval_ms or 0)
+                for timestamp, sent, received, co2_ng, interval_ms in cursor.fetchall()]
+
+    def history(self, start, end):
+        return fetch_history(self.conn.cursor(), start, end)
+
+    def hourly_coverage(self, start, end):
+        return fetch_hourly_coverage(self.conn.cursor(), start, end)
+
+    def aggregate(self, start, end):
+        result = self.conn.execute(f'''
+            SELECT SUM(bytes_sent), SUM(bytes_received), SUM(co2_ng) FROM network_usage
+            WHERE timestamp >= ? AND timestamp < ? AND NOT {RAW_HIDDEN_BY_RESET}
+        ''', (start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))).fetchone()
+        return tuple(total or 0 for total in result)
+
+    def delete_range(self, start, end=None):
+        delete_usage_range(self.conn.cursor(), start, end)
+
+    def totals(self):
+        return load_usage_totals(self.conn.cursor())
+
+    def day_usage(self, day):
+        return load_day_usage(self.conn.cursor(), day)
+
+    def daily_totals(self):
+        cursor = self.conn.cursor()
+        hidden = {}
+        for hour, values in load_hidden_hours(cursor).items():
+            hidden[hour[:10]] = hidden.get(hour[:10], 0) + values[2]
+        cursor.execute('SELECT day, co2_ng FROM daily_summary ORDER BY day')
+        return [(datetime.date.fromisoformat(day), (co2_ng or 0) - hidden.get(day, 0)) for day, co2_ng in cursor.fetchall()]
+
+    def day_summary(self, day):
+        return fetch_day_summary(self.conn.cursor(), day)
+
+    def reset(self, start, end):
+        record_reset(self.conn.cursor(), start, end)
+
+    def undo_reset(self):
+        return undo_last_reset(self.conn.cursor())
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+# Keeps everything in process memory; the reference engine for the conformance checks
+class MemoryBackend(StorageBackend):
+    def __init__(self, co2_per_gb):
+        self.ng_per_gb = nanograms_per_gb(co2_per_gb)
+        self.times = []
+        self.samples = []
+
+    def append_samples(self, records, day_total, day):
+        # Every sample is worked out before the first is inserted, so a bad record leaves nothing behind to roll back
+        samples = []
+        for when, sent_bytes, recv_bytes, interval in records:
+            sent_bytes, recv_bytes = round(sent_bytes), round(recv_bytes)
+            samples.append((when, sent_bytes, recv_bytes, co2_nanograms(sent_bytes + recv_bytes, self.ng_per_gb), round(interval * 1000)))
+
+        stored = []
+        for sample in samples:
+            when, sent_bytes, recv_bytes, co2_ng, _ = sample
+            index = bisect.bisect_right(self.times, when)
+            self.times.insert(index, when)
+            self.samples.insert(index, sample)
+
+            if when.date() > day:
+                day_total = 0
+                day = when.date()
+            if when.date() == day:
+                day_total += co2_ng
+            stored.append((when, co2_ng, sent_bytes + recv_bytes))
+        return day_total, day, stored
+
+    def _range(self, start, end):
+        first = bisect.bisect_left(self.times, start)
+        last = bisect.bisect_left(self.times, end) if end else len(self.times)
+        return first, last
+
+    def range_query(self, start, end):
+        first, last = self._range(start, end)
+        return self.samples[first:last]
+
+    def history(self, start, end):
+        samples = self.range_query(start, end)
+        if end - start <= RAW_HISTORY_MAX_SPAN:
+            return [(when, co2_ng) for when, _, _, co2_ng, _ in samples]
+        hours = {}
+        for when, _, _, co2_ng, _ in samples:
+            hour = when.replace(minute=0, second=0, microsecond=0)
+            hours[hour] = hours.get(hour, 0) + co2_ng
+        return sorted(hours.items())
+
+    def aggregate(self, start, end):
+        samples = self.range_query(start, end)
+        return sum(s[1] for s in samples), sum(s[2] for s in samples), sum(s[3] for s in samples)
+
+    def delete_range(self, start, end=None):
+        first, last = self._range(start, end)
+        del self.times[first:last]
+        del self.samples[first:last]
+
+    def totals(self):
+        sent = sum(s[1] for s in self.samples)
+        received = sum(s[2] for s in self.samples)
+        return sent, received, sent + received
+
+    def day_usage(self, day):
+        start = datetime.datetime.combine(datetime.date.fromisoformat(day), datetime.time.min)
+        return self.aggregate(start, start + datetime.timedelta(days=1))[2]
+
+    def daily_totals(self):
+        days = {}
+        for when, _, _, co2_ng, _ in self.samples:
+            days[when.date()] = days.get(when.date(), 0) + co2_ng
+        return sorted(days.items())
+
+    def day_summary(self, day):
+        start = datetime.datetime.combine(datetime.date.fromisoformat(day), datetime.time.min)
+        samples = self.range_query(start, start + datetime.timedelta(days=1))
+        if not samples:
+            return None
+        sent = sum(s[1] for s in samples)
+        received = sum(s[2] for s in samples)
+        return {
+            'bytes_sent': sent,
+            'bytes_received': received,
+            'total_bytes': sent + received,
+            'co2_ng': sum(s[3] for s in samples),
+            'samples': len(samples),
+            'peak_bytes_per_second': max(bytes_per_second(s[1] + s[2], s[4]) for s in samples),
+            'first_sample': samples[0][0],
+            'last_sample': samples[-1][0],
+        }
@@ -0,0 +1,13 @@
+# Traffic is counted in whole bytes and emissions in whole nanograms of CO2, so sums stay exact;
+# MB, GB and grams only appear when a figure is shown
+BYTES_PER_MB = 1024 * 1024
+BYTES_PER_GB = 1024 * BYTES_PER_MB
+NANOGRAMS_PER_GRAM = 1_000_000_000
+
+# Function to turn a grams-per-GB emission factor into whole nanograms per GB
+def nanograms_per_gb(co2_per_gb):
+    return round(co2_per_gb * NANOGRAMS_PER_GRAM)
+
+# Function to get the emissions of a byte count in whole nanograms (rounded down)
+def co2_nanograms(total_bytes, ng_per_gb):
+    return total_bytes * ng_per_gb // BYTES_PER_GB
@@ -1,5 +1,8 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# Set CO2_TRACKER_GRAPH=sparkline to build without matplotlib; the app then draws its graphs on Tk canvases
+sparkline_build = os.environ.get('CO2_TRACKER_GRAPH') == 'sparkline'
 
 a = Analysis(
     ['SRC\\co2_tracker.py'],
@@ -10,7 +13,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['matplotlib'] if sparkline_build else [],
     noarchive=False,
     optimize=0,
 )
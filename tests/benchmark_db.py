@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SRC'))
+
+from storage import init_usage_tables, write_samples, load_usage_totals, delete_usage_since, SQLiteBackend
+from history import fetch_history, fetch_day_summary, lttb
+from state_store import load_day_usage
+from budgets import load_period_totals
+from maintenance import run_maintenance, enable_incremental_vacuum
+
+CO2_PER_GB = 0.16
+DEFAULT_SIZES = [1_000_000, 10_000_000, 100_000_000]
+FIXTURE_END = datetime.datetime(2026, 1, 1)
+GENERATE_BATCH_ROWS = 1_000_000
+HISTORY_RANGES = {
+    'day': datetime.timedelta(days=1),
+    'week': datetime.timedelta(weeks=1),
+    'month': datetime.timedelta(days=30),
+    'year': datetime.timedelta(days=365),
+}
+
+# Function to build a co2_usage.db in the old MB schema with one sample per minute ending at FIXTURE_END
+def build_fixture(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE network_usage (
+            timestamp TEXT,
+            data_sent REAL,
+            data_received REAL,
+            total_usage REAL,
+            daily_usage REAL
+        )
+    ''')
+    conn.execute('CREATE TABLE start_date (start_date TEXT)')
+
+    # Generate rows inside SQLite, oldest first, like the sampler would have written them
+    end_text = FIXTURE_END.strftime('%Y-%m-%d %H:%M:%S')
+    for offset in range(0, rows, GENERATE_BATCH_ROWS):
+        count = min(GENERATE_BATCH_ROWS, rows - offset)
+        conn.execute('''
+            WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i + 1 < ?),
+            samples AS (
+                SELECT ? - ? - i AS minutes_ago,
+                       abs(random() % 1000) / 4000.0 AS sent,
+                       abs(random() % 1000) / 500.0 AS received
+                FROM seq
+            )
+            INSERT INTO network_usage (timestamp, data_sent, data_received, total_usage, daily_usage)
+            SELECT strftime('%Y-%m-%d %H:%M:%S', ?, '-' || minutes_ago || ' minutes'), sent, received, sent + received, 0
+            FROM samples
+        ''', (count, rows, offset, end_text))
+        conn.commit()
+
+    conn.execute('INSERT INTO start_date (start_date) VALUES (?)',
+                 ((FIXTURE_END - datetime.timedelta(minutes=rows)).strftime('%Y-%m-%d'),))
+    conn.commit()
+
+    # The app's start-up switches to incremental auto-vacuum, converts the samples to bytes and builds the index and rollups
+    started = time.perf_counter()
+    enable_incremental_vacuum(conn)
+    init_usage_tables(conn.cursor(), CO2_PER_GB)
+    conn.commit()
+    upgrade_seconds = time.perf_counter() - started
+
+    conn.execute('CREATE TABLE benchmark_fixture (rows INTEGER, upgrade_seconds REAL)')
+    conn.execute('INSERT INTO benchmark_fixture VALUES (?, ?)', (rows, upgrade_seconds))
+    conn.commit()
+    conn.close()
+
+# Function to reuse a finished fixture or build a new one
+def get_fixture(fixture_dir, rows):
+    db_path = os.path.join(fixture_dir, f'co2_usage_{rows}.db')
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            result = conn.execute('SELECT rows, upgrade_seconds FROM benchmark_fixture').fetchone()
+            if result and result[0] == rows:
+                return db_path, result[1], 0
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+        os.remove(db_path)
+
+    started = time.perf_counter()
+    build_fixture(db_path, rows)
+    build_seconds = time.perf_counter() - started
+    conn = sqlite3.connect(db_path)
+    upgrade_seconds = conn.execute('SELECT upgrade_seconds FROM benchmark_fixture').fetchone()[0]
+    conn.close()
+    return db_path, upgrade_seconds, build_seconds
+
+# Function to time a callable and summarize the runs in milliseconds
+def time_path(function, repeats):
+    runs = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        runs.append((time.perf_counter() - started) * 1000)
+    return {'min_ms': min(runs), 'median_ms': statistics.median(runs), 'max_ms': max(runs)}
+
+# Function to time every read and write path the app runs against the database
+def benchmark_paths(db_path, repeats, include_maintenance):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    timings = {}
+
+    # Function to take out every sample written after the fixture was built, so reused fixtures stay the same
+    def remove_written_samples():
+        delete_usage_since(cursor, FIXTURE_END.strftime('%Y-%m-%d'))
+        conn.commit()
+
+    # Fixtures used by earlier versions of this benchmark still hold the samples it wrote
+    remove_written_samples()
+    last_day = cursor.execute('SELECT MAX(timestamp) FROM network_usage').fetchone()[0][:10]
+    end = datetime.datetime.fromisoformat(last_day) + datetime.timedelta(days=1)
+
+    def write_sample():
+        record = (end + datetime.timedelta(minutes=1), 150_000, 1_200_000, 60)
+        write_samples(cursor, [record], CO2_PER_GB, 0, record[0].date())
+        conn.commit()
+
+    def reset_delete():
+        # Measure the old reset DELETE without destroying the fixture
+        delete_usage_since(cursor, last_day)
+        conn.rollback()
+
+    def reset_marker():
+        # The Reset button records a marker instead of deleting rows
+        SQLiteBackend(conn, CO2_PER_GB).reset(datetime.datetime.fromisoformat(last_day), end)
+        conn.rollback()
+
+    timings['write_sample'] = time_path(write_sample, repeats)
+    remove_written_samples()
+    timings['load_usage_totals'] = time_path(lambda: load_usage_totals(cursor), repeats)
+    timings['legacy_full_sum'] = time_path(lambda: cursor.execute(
+        'SELECT SUM(bytes_sent), SUM(bytes_received), SUM(co2_ng) FROM network_usage').fetchone(), repeats)
+    for name, span in HISTORY_RANGES.items():
+        timings[f'history_{name}'] = time_path(lambda span=span: lttb(fetch_history(cursor, end - span, end), 600), repeats)
+    timings['load_day_usage'] = time_path(lambda: load_day_usage(cursor, last_day), repeats)
+    # What the app reads at start (projection, budgets) and on every refresh (today's summary)
+    storage = SQLiteBackend(conn, CO2_PER_GB)
+    timings['daily_totals'] = time_path(storage.daily_totals, repeats)
+    timings['fetch_day_summary'] = time_path(lambda: fetch_day_summary(cursor, last_day), repeats)
+    timings['load_period_totals'] = time_path(lambda: load_period_totals(storage, datetime.date.fromisoformat(last_day)), repeats)
+    timings['reset_delete'] = time_path(reset_delete, repeats)
+    timings['reset_marker'] = time_path(reset_marker, repeats)
+
+    # Maintenance compacts the fixture, so it runs last and only once
+    if include_maintenance:
+        timings['maintenance'] = time_path(lambda: run_maintenance(conn, 200 * 1024 * 1024, 90, end), 1)
+        cursor.execute('DELETE FROM benchmark_fixture')
+        conn.commit()
+
+    conn.close()
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the tracker's database paths on large co2_usage.db fixtures.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="network_usage row counts to test")
+    parser.add_argument('--repeats', type=int, default=5, help="Runs per timed path")
+    parser.add_argument('--fixture-dir', default=os.path.join(tempfile.gettempdir(), 'co2_tracker_fixtures'),
+                        help="Where fixtures are built and reused between runs")
+    parser.add_argument('--maintenance', action='store_true', help="Also time a maintenance run (rebuilds the fixture next time)")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    os.makedirs(args.fixture_dir, exist_ok=True)
+    report = {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'results': [],
+    }
+    for rows in args.sizes:
+        db_path, upgrade_seconds, build_seconds = get_fixture(args.fixture_dir, rows)
+        report['results'].append({
+            'rows': rows,
+            'db_size_bytes': os.path.getsize(db_path),
+            'fixture_build_seconds': build_seconds,
+            'schema_upgrade_seconds': upgrade_seconds,
+            'timings': benchmark_paths(db_path, args.repeats, args.maintenance),
+        })
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output)
+    else:
+        print(output)
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import datetime
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SRC'))
+
+from collector import CollectorClient
+
+COLLECTOR_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SRC', 'collector.py')
+START = datetime.datetime(2026, 1, 1).timestamp()
+
+# Function to raise the open file limit so thousands of connections fit in one process
+def raise_file_limit():
+    try:
+        import resource
+    except ImportError:
+        return  # Not available on Windows
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+# Function to wait until the collector accepts connections
+async def wait_for_collector(address, process, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("collector exited during startup")
+        try:
+            client = CollectorClient(address, 'probe')
+            await client.connect()
+            await client.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("collector did not start")
+
+# Function to act as one tracker: send minute samples in batches and wait for every ack
+async def run_host(address, index, minutes, batch_samples, connect_slots, compress):
+    rng = random.Random(index)
+    client = CollectorClient(address, f'host-{index:06d}', compress=compress)
+    async with connect_slots:
+        await client.connect()
+    try:
+        for first in range(0, minutes, batch_samples):
+            samples = [(START + minute * 60, rng.randrange(1 << 20), rng.randrange(1 << 23))
+                       for minute in range(first, min(first + batch_samples, minutes))]
+            await client.send(samples)
+        await client.flush()
+    finally:
+        await client.close()
+
+# Function to push a swarm of simulated hosts through a collector and report ingest throughput
+async def run_swarm(address, hosts, minutes, batch_samples, max_connecting, compress=False):
+    connect_slots = asyncio.Semaphore(max_connecting)
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_host(address, index, minutes, batch_samples, connect_slots, compress) for index in range(hosts)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - started
+    failures = [result for result in results if isinstance(result, Exception)]
+    return elapsed, failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive a collector with a swarm of simulated tracker instances.")
+    parser.add_argument('--hosts', type=int, default=2000, help="Simulated tracker instances, one connection each")
+    parser.add_argument('--minutes', type=int, default=60, help="One-minute samples sent by each host")
+    parser.add_argument('--batch-samples', type=int, default=5, help="Samples per batch")
+    parser.add_argument('--compress', action='store_true', help="Send zlib-compressed batches like the tracker's uploader")
+    parser.add_argument('--max-connecting', type=int, default=256, help="Connections opened at once")
+    parser.add_argument('--address', help="Collector address (default: start one on a temporary Unix socket)")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, 'collector.db')
+    address = args.address or (f"unix://{os.path.join(workdir, 'collector.sock')}" if hasattr(asyncio, 'open_unix_connection') and os.name != 'nt'
+                               else 'tcp://127.0.0.1:7717')
+
+    # The collector runs in its own process, as it would in production, so the swarm does not share its CPU time
+    process = None
+    if not args.address:
+        process = subprocess.Popen([sys.executable, COLLECTOR_SCRIPT, '--listen', address, '--db', db_path], stdout=subprocess.DEVNULL)
+    try:
+        if process:
+            asyncio.run(wait_for_collector(address, process))
+        elapsed, failures = asyncio.run(run_swarm(address, args.hosts, args.minutes, args.batch_samples, args.max_connecting, args.compress))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    rows = args.hosts * args.minutes
+    report = {
+        'hosts': args.hosts,
+        'rows_sent': rows,
+        'failed_hosts': len(failures),
+        'wall_seconds': elapsed,
+        'rows_per_second': rows / elapsed,
+        # Rows per second a fleet of this size produces at one-minute resolution
+        'realtime_rows_per_second': args.hosts / 60,
+        'headroom': rows / elapsed / (args.hosts / 60),
+    }
+    if process:
+        conn = sqlite3.connect(db_path)
+        report['rows_stored'] = conn.execute('SELECT COUNT(*) FROM host_usage').fetchone()[0]
+        report['hosts_stored'] = conn.execute("SELECT COUNT(*) FROM hosts WHERE name != 'probe'").fetchone()[0]
+        conn.close()
+    for failure in failures[:5]:
+        print(f"host failed: {failure!r}", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+    sys.exit(1 if failures or report.get('rows_stored', rows) != rows else 0)
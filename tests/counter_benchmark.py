@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SRC'))
+
+from net_counters import ProcNetDevReader, psutil_counters
+
+# Function to time a counter reader, returns microseconds per call for each round
+def time_reader(read, calls, rounds):
+    read()  # Warm up caches and imports
+    runs = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(calls):
+            read()
+        runs.append((time.perf_counter() - started) / calls * 1_000_000)
+    return {'min_us': min(runs), 'median_us': statistics.median(runs), 'max_us': max(runs)}
+
+# Function to check that the fast reader reports the same totals as psutil
+def compare_readers(fast_read, attempts=5):
+    for _ in range(attempts):
+        # Counters move between the reads, so the psutil reading must sit between two fast ones
+        before = fast_read()
+        reference = psutil_counters()
+        after = fast_read()
+        if all(low <= value <= high for low, value, high in zip(before, reference, after)):
+            return True
+    return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the /proc/net/dev counter reader with psutil.net_io_counters().")
+    parser.add_argument('--calls', type=int, default=10_000, help="Reads per timed round")
+    parser.add_argument('--rounds', type=int, default=5, help="Timed rounds per reader")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = {'psutil': time_reader(psutil_counters, args.calls, args.rounds)}
+    matches = True
+    try:
+        reader = ProcNetDevReader()
+    except OSError as e:
+        print(f"proc reader unavailable: {e}", file=sys.stderr)
+    else:
+        report['proc_net_dev'] = time_reader(reader.read, args.calls, args.rounds)
+        report['speedup'] = report['psutil']['median_us'] / report['proc_net_dev']['median_us']
+        matches = compare_readers(reader.read)
+        report['totals_match_psutil'] = matches
+        reader.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            if isinstance(value, dict):
+                print(f"{key}: " + ", ".join(f"{name} {number:.2f}" for name, number in value.items()))
+            else:
+                print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    sys.exit(0 if matches else 1)
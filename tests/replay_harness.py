@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+import tempfile
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SRC'))
+
+from sampler import Sampler, SAMPLE_INTERVAL
+from storage import init_usage_tables, SQLiteBackend, MemoryBackend
+from projection import ProjectionModel
+from units import BYTES_PER_MB, NANOGRAMS_PER_GRAM
+
+CO2_PER_GB = 0.16
+
+snetio = namedtuple('snetio', ['bytes_sent', 'bytes_recv'])
+
+# Simulated time shared by the sampler's elapsed clock and its wall clock
+class SimulatedClock:
+    def __init__(self, start):
+        self.start = start
+        self.elapsed = 0.0
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+
+    def clock(self):
+        return self.elapsed
+
+    def now(self):
+        return self.start + datetime.timedelta(seconds=self.elapsed)
+
+# Deterministic stand-in for psutil.net_io_counters() with a day/night traffic pattern
+class SyntheticCounters:
+    def __init__(self, clock, seed=0, peak_mb_per_minute=20):
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.peak_bytes_per_second = peak_mb_per_minute * BYTES_PER_MB / 60
+        self.bytes_sent = 0
+        self.bytes_recv = 0
+        self.last_elapsed = 0.0
+
+    # Function to advance the counters to the clock's current time
+    def _catch_up(self):
+        seconds = self.clock.elapsed - self.last_elapsed
+        if seconds <= 0:
+            return
+        hour = self.clock.now().hour
+        # Busy during the day, almost idle at night, with occasional bursts
+        activity = 0.05 if hour < 7 else 1.0 if 9 <= hour < 23 else 0.4
+        if self.random.random() < 0.01:
+            activity *= 10
+        received = int(seconds * self.peak_bytes_per_second * activity * self.random.random())
+        self.bytes_recv += received
+        self.bytes_sent += received // 8
+        self.last_elapsed = self.clock.elapsed
+
+    # Function with the same shape as psutil.net_io_counters()
+    def net_io_counters(self):
+        self._catch_up()
+        return snetio(self.bytes_sent, self.bytes_recv)
+
+# Function to replay a synthetic counter stream through sampling, storage, rollups and totals
+def run_replay(db_path, days=365, interval=SAMPLE_INTERVAL, seed=0, gap_every=0, commit_every=1, engine='sqlite'):
+    clock = SimulatedClock(datetime.datetime(2024, 1, 1))
+    counters = SyntheticCounters(clock, seed)
+    sampler = Sampler(clock=clock.clock, wall_clock=clock.now, interval=interval)
+    projection = ProjectionModel()
+
+    if engine == 'binlog':
+        # Imported here so the SQLite replay does not need NumPy
+        from sample_log import SampleLog
+        storage = SampleLog(db_path, CO2_PER_GB)
+    elif engine == 'memory':
+        storage = MemoryBackend(CO2_PER_GB)
+    else:
+        conn = sqlite3.connect(db_path)
+        init_usage_tables(conn.cursor(), CO2_PER_GB)
+        conn.commit()
+        storage = SQLiteBackend(conn, CO2_PER_GB)
+
+    io = counters.net_io_counters()
+    sampler.start(io.bytes_sent, io.bytes_recv)
+    day_total, day = 0, clock.now().date()
+    steps = int(days * 86400 / interval)
+    latencies = []
+    records_written = 0
+
+    started = time.perf_counter()
+    for step in range(1, steps + 1):
+        # Every gap_every samples, pretend the machine slept for three hours
+        if gap_every and step % gap_every == 0:
+            clock.advance(3 * 3600)
+        clock.advance(interval)
+        io = counters.net_io_counters()
+
+        sample_started = time.perf_counter()
+        records = sampler.sample(io.bytes_sent, io.bytes_recv)
+        day_total, day, stored = storage.append_samples(records, day_total, day)
+        if step % commit_every == 0:
+            storage.commit()
+        for when, co2_ng, _ in stored:
+            projection.add_sample(when, co2_ng)
+        latencies.append(time.perf_counter() - sample_started)
+        records_written += len(records)
+    storage.commit()
+    elapsed = time.perf_counter() - started
+
+    # Totals from the rollups must match what the synthetic counters produced
+    total_sent, total_received, _ = storage.totals()
+    storage.close()
+    if engine == 'binlog':
+        db_size = os.path.getsize(db_path) + os.path.getsize(db_path + '.idx')
+    elif engine == 'memory':
+        db_size = 0
+    else:
+        db_size = os.path.getsize(db_path)
+
+    latencies.sort()
+    return {
+        'simulated_days': clock.elapsed / 86400,
+        'samples': steps,
+        'records_written': records_written,
+        'wall_seconds': elapsed,
+        'samples_per_second': steps / elapsed if elapsed else 0,
+        'latency_p50_ms': latencies[len(latencies) // 2] * 1000,
+        'latency_p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'latency_max_ms': latencies[-1] * 1000,
+        'db_size_bytes': db_size,
+        'sent_error_bytes': total_sent - counters.bytes_sent,
+        'received_error_bytes': total_received - counters.bytes_recv,
+        'projected_yearly_grams': projection.forecast_yearly(clock.now()) / NANOGRAMS_PER_GRAM,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay synthetic traffic through the tracker pipeline at accelerated time.")
+    parser.add_argument('--days', type=float, default=365, help="Simulated days to replay")
+    parser.add_argument('--interval', type=int, default=SAMPLE_INTERVAL, help="Simulated seconds between samples")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic traffic")
+    parser.add_argument('--gap-every', type=int, default=0, help="Insert a 3 hour sleep gap every N samples")
+    parser.add_argument('--commit-every', type=int, default=1, help="Samples per transaction (the app commits every sample)")
+    parser.add_argument('--engine', choices=['sqlite', 'binlog', 'memory'], default='sqlite', help="Storage engine to write to")
+    parser.add_argument('--db', help="Database file to write (default: a temporary file)")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'replay.db')
+    report = run_replay(db_path, args.days, args.interval, args.seed, args.gap_every, args.commit_every, args.engine)
+    report['db_path'] = db_path
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
@@ -0,0 +1,257 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SRC'))
+
+from storage import init_usage_tables, SQLiteBackend, MemoryBackend
+
+CO2_PER_GB = 0.16
+MB = 1024 * 1024
+MINUTE_NG = 781_250  # 5 MB at 0.16 g/GB, a whole number of nanograms
+START = datetime.datetime(2026, 3, 1, 22, 0)
+
+# Function to open a fresh SQLite backend
+def make_sqlite(directory):
+    conn = sqlite3.connect(os.path.join(directory, 'co2_usage.db'))
+    init_usage_tables(conn.cursor(), CO2_PER_GB)
+    conn.commit()
+    return SQLiteBackend(conn, CO2_PER_GB)
+
+# Function to open a fresh binary sample log backend
+def make_binlog(directory):
+    from sample_log import SampleLog
+    return SampleLog(os.path.join(directory, 'samples.log'), CO2_PER_GB)
+
+# Function to open a fresh in-memory backend
+def make_memory(directory):
+    return MemoryBackend(CO2_PER_GB)
+
+ENGINES = {
+    'sqlite': make_sqlite,
+    'binlog': make_binlog,
+    'memory': make_memory,
+}
+
+# Function to build one sample per minute for the given number of minutes
+def minute_records(start, minutes, sent=MB, received=4 * MB):
+    return [(start + datetime.timedelta(minutes=i), sent, received, 60) for i in range(minutes)]
+
+def assert_equal(actual, expected, what):
+    if actual != expected:
+        raise AssertionError(f"{what}: expected {expected}, got {actual}")
+
+def check_append_and_totals(storage):
+    day_total, day, stored = storage.append_samples(minute_records(START, 180), 0, START.date())
+    storage.commit()
+    assert len(stored) == 180, "one stored entry per record"
+    assert_equal(storage.totals(), (180 * MB, 720 * MB, 900 * MB), "sent, received and total bytes")
+    # 22:00 to 01:00 crosses midnight, so the running day total restarts
+    assert day == (START + datetime.timedelta(days=1)).date(), "day advances past midnight"
+    assert_equal(day_total, 60 * MINUTE_NG, "running day total")
+
+def check_range_query(storage):
+    storage.append_samples(minute_records(START, 120), 0, START.date())
+    storage.commit()
+    samples = storage.range_query(START + datetime.timedelta(minutes=10), START + datetime.timedelta(minutes=20))
+    assert len(samples) == 10, f"range is half-open, got {len(samples)} samples"
+    assert samples[0][0] == START + datetime.timedelta(minutes=10), "samples are ordered by time"
+    assert_equal(samples[0][1], MB, "sent bytes")
+    assert_equal(samples[0][3], MINUTE_NG, "nanograms")
+    assert_equal(samples[0][4], 60_000, "interval milliseconds")
+
+def check_out_of_order_append(storage):
+    storage.append_samples(minute_records(START + datetime.timedelta(minutes=30), 10), 0, START.date())
+    storage.append_samples(minute_records(START, 10), 0, START.date())
+    storage.commit()
+    times = [sample[0] for sample in storage.range_query(START, START + datetime.timedelta(hours=1))]
+    assert times == sorted(times) and len(times) == 20, "late records are kept in time order"
+
+def check_history(storage):
+    storage.append_samples(minute_records(START, 600), 0, START.date())
+    storage.commit()
+    short = storage.history(START, START + datetime.timedelta(hours=1))
+    assert len(short) == 60, "short spans return raw samples"
+    long = storage.history(START, START + datetime.timedelta(days=7))
+    assert len(long) == 10, f"long spans are summed per hour, got {len(long)} points"
+    assert_equal(long[0][1], 60 * MINUTE_NG, "hourly nanograms")
+
+def check_hourly_coverage(storage):
+    # 22:00-23:00 fully sampled, 23:00 only its first 10 minutes, at a mix of one-minute and 30-second samples
+    records = minute_records(START, 70)
+    records += [(START + datetime.timedelta(minutes=70, seconds=30 * i), MB, 4 * MB, 30) for i in range(1, 11)]
+    storage.append_samples(records, 0, START.date())
+    storage.commit()
+    hours = storage.hourly_coverage(START, START + datetime.timedelta(hours=2))
+    assert_equal([hour for hour, _, _ in hours], [START, START + datetime.timedelta(hours=1)], "hours with samples")
+    assert_equal(hours[0][1:], (60 * MINUTE_NG, 3600), "full hour nanograms and seconds")
+    assert_equal(hours[1][1:], (20 * MINUTE_NG, 900), "partial hour nanograms and seconds")
+
+def check_aggregate(storage):
+    storage.append_samples(minute_records(START, 60), 0, START.date())
+    storage.commit()
+    assert_equal(storage.aggregate(START, START + datetime.timedelta(minutes=30)), (30 * MB, 120 * MB, 30 * MINUTE_NG),
+                 "aggregate bytes and nanograms")
+
+def check_exact_accounting(storage):
+    # Odd byte counts whose emissions are not whole nanograms: sums must still be exact integers
+    sent, received = 123_457, 987_655
+    per_sample_ng = (sent + received) * 160_000_000 // 2 ** 30
+    storage.append_samples(minute_records(START, 1440, sent, received), 0, START.date())
+    storage.commit()
+    assert_equal(storage.totals(), (1440 * sent, 1440 * received, 1440 * (sent + received)), "totals in bytes")
+    assert_equal(storage.day_usage(START.date().isoformat()), 120 * per_sample_ng, "day nanograms")
+    assert_equal(storage.aggregate(START, START + datetime.timedelta(days=1)), (1440 * sent, 1440 * received, 1440 * per_sample_ng),
+                 "aggregate over the whole range")
+    assert_equal(sum(ng for _, ng in storage.daily_totals()), 1440 * per_sample_ng, "daily totals add up")
+
+def check_day_usage(storage):
+    storage.append_samples(minute_records(START, 240), 0, START.date())
+    storage.commit()
+    assert_equal(storage.day_usage(START.date().isoformat()), 120 * MINUTE_NG, "first day nanograms")
+    days = dict(storage.daily_totals())
+    assert len(days) == 2, "two days stored"
+    assert_equal(days[(START + datetime.timedelta(days=1)).date()], 120 * MINUTE_NG, "second day nanograms")
+
+def check_day_summary(storage):
+    records = minute_records(START, 240)
+    records[30] = (records[30][0], 3 * MB, 12 * MB, 60)  # One busier minute on the first day
+    records[31] = (records[31][0], MB, 4 * MB, 2)  # Fewer bytes, but over 2 seconds: the fastest rate
+    storage.append_samples(records, 0, START.date())
+    storage.commit()
+    summary = storage.day_summary(START.date().isoformat())
+    assert summary['samples'] == 120, f"first day samples, got {summary['samples']}"
+    assert_equal(summary['bytes_sent'], 122 * MB, "first day sent bytes")
+    assert_equal(summary['bytes_received'], 488 * MB, "first day received bytes")
+    assert_equal(summary['total_bytes'], 610 * MB, "first day total bytes")
+    assert_equal(summary['co2_ng'], 122 * MINUTE_NG, "first day nanograms")
+    assert_equal(summary['peak_bytes_per_second'], 2.5 * MB, "peak bytes per second")
+    assert summary['first_sample'] == START and summary['last_sample'] == START + datetime.timedelta(minutes=119)
+    assert storage.day_summary('2020-01-01') is None, "days without samples have no summary"
+
+    # Deleting part of a day shrinks its summary
+    storage.delete_range(START + datetime.timedelta(minutes=60))
+    storage.commit()
+    summary = storage.day_summary(START.date().isoformat())
+    assert summary['samples'] == 60, f"samples after delete, got {summary['samples']}"
+    assert_equal(summary['co2_ng'], 62 * MINUTE_NG, "nanograms after delete")
+    assert storage.day_summary((START + datetime.timedelta(days=1)).date().isoformat()) is None, "deleted day is gone"
+
+def check_reset_and_undo(storage):
+    storage.append_samples(minute_records(START, 240), 0, START.date())
+    storage.commit()
+    day = START.date().isoformat()
+    before = (storage.totals(), storage.day_usage(day), storage.history(START, START + datetime.timedelta(days=7)))
+
+    # Reset from 22:30 to 23:30 on the first day
+    storage.reset(START + datetime.timedelta(minutes=30), START + datetime.timedelta(minutes=90))
+    storage.commit()
+    assert_equal(storage.totals()[2], 180 * 5 * MB, "total bytes after a reset")
+    assert_equal(storage.day_usage(day), 60 * MINUTE_NG, "day nanograms after a reset")
+    assert storage.day_summary(day)['samples'] == 60, "day summary after a reset"
+    assert len(storage.range_query(START, START + datetime.timedelta(hours=2))) == 60, "raw samples after a reset"
+    assert_equal(storage.history(START, START + datetime.timedelta(days=7))[0][1], 30 * MINUTE_NG, "hour after a reset")
+
+    # Samples stored after the reset stay visible even inside its range
+    storage.append_samples([(START + datetime.timedelta(minutes=45, seconds=30), MB, 4 * MB, 30)], 0, START.date())
+    storage.commit()
+    assert storage.day_summary(day)['samples'] == 61, "late sample after a reset"
+
+    restored = storage.undo_reset()
+    storage.commit()
+    if storage.supports_undo:
+        assert restored == (START + datetime.timedelta(minutes=30), START + datetime.timedelta(minutes=90)), "undo returns the range"
+        assert_equal(storage.totals()[2], 241 * 5 * MB, "total bytes after undo")
+        assert_equal(storage.day_usage(day), before[1] + MINUTE_NG, "day nanograms after undo")
+        assert storage.day_summary(day)['samples'] == 121, "day summary after undo"
+        assert storage.undo_reset() is None, "nothing left to undo"
+    else:
+        assert restored is None, "engines without undo delete right away"
+
+def check_delete_range(storage):
+    storage.append_samples(minute_records(START, 240), 0, START.date())
+    storage.commit()
+    # Delete 22:30 to 23:30, which cuts two hours in half
+    storage.delete_range(START + datetime.timedelta(minutes=30), START + datetime.timedelta(minutes=90))
+    storage.commit()
+    assert_equal(storage.totals()[2], 180 * 5 * MB, "total bytes after a middle delete")
+    assert_equal(storage.day_usage(START.date().isoformat()), 60 * MINUTE_NG, "day nanograms after a middle delete")
+    hours = storage.history(START, START + datetime.timedelta(days=3))
+    assert_equal(hours[0][1], 30 * MINUTE_NG, "partly deleted hour")
+
+    # Delete everything from midnight on, like the Reset button
+    storage.delete_range(datetime.datetime.combine(START.date() + datetime.timedelta(days=1), datetime.time.min))
+    storage.commit()
+    assert_equal(storage.totals()[2], 60 * 5 * MB, "total bytes after deleting the tail")
+    assert storage.range_query(START, START + datetime.timedelta(days=2))[-1][0] < START + datetime.timedelta(hours=2)
+
+CHECKS = [
+    check_append_and_totals,
+    check_range_query,
+    check_out_of_order_append,
+    check_history,
+    check_hourly_coverage,
+    check_aggregate,
+    check_exact_accounting,
+    check_day_usage,
+    check_day_summary,
+    check_reset_and_undo,
+    check_delete_range,
+]
+
+# Function to time appending a day of samples and reading it back
+def benchmark(make_backend, minutes):
+    with tempfile.TemporaryDirectory() as directory:
+        storage = make_backend(directory)
+        records = minute_records(START, minutes)
+        started = time.perf_counter()
+        for record in records:
+            storage.append_samples([record], 0, START.date())
+            storage.commit()
+        append_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        storage.history(START, START + datetime.timedelta(minutes=minutes))
+        history_seconds = time.perf_counter() - started
+        storage.close()
+    return append_seconds, history_seconds
+
+# Function to run every check against a backend, returns the failures
+def run_conformance(make_backend):
+    failures = []
+    for check in CHECKS:
+        with tempfile.TemporaryDirectory() as directory:
+            storage = make_backend(directory)
+            try:
+                check(storage)
+            except Exception as e:
+                failures.append(f"{check.__name__}: {e}")
+            finally:
+                storage.close()
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check storage backends against the StorageBackend contract and compare their speed.")
+    parser.add_argument('engines', nargs='*', default=list(ENGINES), help="Engines to check (default: all)")
+    parser.add_argument('--minutes', type=int, default=10_000, help="Samples appended in the benchmark")
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.engines:
+        try:
+            failures = run_conformance(ENGINES[name])
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+            continue
+        failed = failed or bool(failures)
+        for failure in failures:
+            print(f"{name}: FAIL {failure}")
+        append_seconds, history_seconds = benchmark(ENGINES[name], args.minutes)
+        print(f"{name}: {len(CHECKS) - len(failures)}/{len(CHECKS)} checks passed, "
+              f"{args.minutes / append_seconds:.0f} appends/s, history read {history_seconds * 1000:.1f} ms")
+
+    sys.exit(1 if failed else 0)